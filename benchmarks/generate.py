@@ -0,0 +1,164 @@
+#
+# Writes a synthetic corpus of IRS 990, 990EZ and 990PF filings with the structure the extractor reads
+#
+
+import pathlib
+import random
+
+import click
+
+FORM_TYPES = ["990", "990EZ", "990PF"]
+
+# files per directory, the IRS downloads come in folders of a similar size
+FILES_PER_DIRECTORY = 1000
+
+CITIES = [("Springfield", "IL", "62701"), ("Boston", "MA", "02110"), ("Austin", "TX", "73301"), ("Denver", "CO", "80202")]
+WORDS = ["Community", "Health", "Education", "Arts", "Foundation", "Trust", "Relief", "Youth", "Science", "Heritage"]
+
+
+def name(rng: random.Random, words: int = 3) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def us_address(rng: random.Random, tag_name: str) -> str:
+    city, state, zipcode = rng.choice(CITIES)
+    return (
+        f"<{tag_name}><AddressLine1Txt>{rng.randint(1, 9999)} Main St</AddressLine1Txt><CityNm>{city}</CityNm>"
+        f"<StateAbbreviationCd>{state}</StateAbbreviationCd><ZIPCd>{zipcode}</ZIPCd></{tag_name}>"
+    )
+
+
+def foreign_address(rng: random.Random) -> str:
+    return (
+        f"<RecipientForeignAddress><AddressLine1Txt>{rng.randint(1, 99)} Rue Haute</AddressLine1Txt><CityNm>Paris</CityNm>"
+        f"<CountryCd>FR</CountryCd></RecipientForeignAddress>"
+    )
+
+
+def header(rng: random.Random, form_type: str, ein: str, year: int) -> str:
+    preparer = ""
+    if rng.random() < 0.9:
+        preparer = (
+            f"<PreparerFirmGrp><PreparerFirmEIN>{rng.randint(10**8, 10**9 - 1)}</PreparerFirmEIN>"
+            f"<PreparerFirmName><BusinessNameLine1Txt>{name(rng, 2)} &amp; Co</BusinessNameLine1Txt></PreparerFirmName>"
+            f"{us_address(rng, 'PreparerUSAddress')}</PreparerFirmGrp>"
+        )
+
+    return (
+        f"<ReturnHeader binaryAttachmentCnt=\"0\"><ReturnTs>{year + 1}-05-15T10:00:00-05:00</ReturnTs>"
+        f"<TaxPeriodEndDt>{year}-12-31</TaxPeriodEndDt>{preparer}<ReturnTypeCd>{form_type}</ReturnTypeCd>"
+        f"<TaxPeriodBeginDt>{year}-01-01</TaxPeriodBeginDt>"
+        f"<Filer><EIN>{ein}</EIN><BusinessName><BusinessNameLine1Txt>{name(rng)}</BusinessNameLine1Txt></BusinessName>"
+        f"<BusinessNameControlTxt>ORG</BusinessNameControlTxt><PhoneNum>{rng.randint(10**9, 10**10 - 1)}</PhoneNum>"
+        f"{us_address(rng, 'USAddress')}</Filer>"
+        f"<BusinessOfficerGrp><PersonNm>{name(rng, 2)}</PersonNm><PersonTitleTxt>President</PersonTitleTxt></BusinessOfficerGrp>"
+        f"<TaxYr>{year}</TaxYr></ReturnHeader>"
+    )
+
+
+def irs990(rng: random.Random, staff: int) -> str:
+    employees = "".join(
+        f"<Form990PartVIISectionAGrp><PersonNm>{name(rng, 2)}</PersonNm><TitleTxt>Director</TitleTxt>"
+        f"<AverageHoursPerWeekRt>1.00</AverageHoursPerWeekRt>"
+        f"<ReportableCompFromOrgAmt>{rng.randint(0, 300_000)}</ReportableCompFromOrgAmt></Form990PartVIISectionAGrp>"
+        for _ in range(staff)
+    )
+    return (
+        f"<IRS990><ActivityOrMissionDesc>{name(rng, 8)}</ActivityOrMissionDesc>"
+        f"<TotalEmployeeCnt>{rng.randint(0, 500)}</TotalEmployeeCnt><TotalVolunteersCnt>{rng.randint(0, 100)}</TotalVolunteersCnt>"
+        f"<RevenueAmt>{rng.randint(0, 10**7)}</RevenueAmt><ExpenseAmt>{rng.randint(0, 10**7)}</ExpenseAmt>"
+        f"{employees}<IndivRcvdGreaterThan100KCnt>{rng.randint(0, 5)}</IndivRcvdGreaterThan100KCnt>"
+        f"<DonorAdvisedFundInd>0</DonorAdvisedFundInd><LocalChaptersInd>0</LocalChaptersInd></IRS990>"
+    )
+
+
+def irs990ez(rng: random.Random, staff: int) -> str:
+    officers = "".join(
+        f"<OfficerDirectorTrusteeEmplGrp><PersonNm>{name(rng, 2)}</PersonNm>{us_address(rng, 'RecipientUSAddress')}"
+        f"<TitleTxt>Treasurer</TitleTxt><AverageHrsPerWkDevotedToPosRt>2.00</AverageHrsPerWkDevotedToPosRt>"
+        f"<CompensationAmt>{rng.randint(0, 50_000)}</CompensationAmt></OfficerDirectorTrusteeEmplGrp>"
+        for _ in range(staff)
+    )
+    return f"<IRS990EZ><TrnsfrExmptNonChrtblRltdOrgInd>false</TrnsfrExmptNonChrtblRltdOrgInd>{officers}</IRS990EZ>"
+
+
+def irs990pf(rng: random.Random, staff: int, grants: int) -> str:
+    officers = "".join(
+        f"<OfficerDirTrstKeyEmplGrp><PersonNm>{name(rng, 2)}</PersonNm><TitleTxt>Trustee</TitleTxt>"
+        f"<CompensationAmt>{rng.randint(0, 50_000)}</CompensationAmt></OfficerDirTrstKeyEmplGrp>"
+        for _ in range(staff)
+    )
+
+    amounts = [rng.randint(100, 100_000) for _ in range(grants)]
+    grant_groups = "".join(
+        f"<GrantOrContributionPdDurYrGrp><RecipientBusinessName><BusinessNameLine1Txt>{name(rng)}</BusinessNameLine1Txt>"
+        f"</RecipientBusinessName>{us_address(rng, 'RecipientUSAddress') if rng.random() < 0.95 else foreign_address(rng)}"
+        f"<RecipientFoundationStatusTxt>PC</RecipientFoundationStatusTxt>"
+        f"<GrantOrContributionPurposeTxt>{name(rng, 4)}</GrantOrContributionPurposeTxt><Amt>{amount}</Amt>"
+        f"</GrantOrContributionPdDurYrGrp>"
+        for amount in amounts
+    )
+
+    return (
+        f"<IRS990PF><FMVAssetsEOYAmt>{rng.randint(0, 10**8)}</FMVAssetsEOYAmt>"
+        f"<PersonsWithBooksName><BusinessNameLine1Txt>{name(rng)}</BusinessNameLine1Txt></PersonsWithBooksName>"
+        f"<PhoneNum>{rng.randint(10**9, 10**10 - 1)}</PhoneNum>{us_address(rng, 'LocationOfBooksUSAddress')}"
+        f"<OfficerDirTrstKeyEmplInfoGrp>{officers}<OtherEmployeePaidOver50kCnt>{rng.randint(0, 20)}</OtherEmployeePaidOver50kCnt>"
+        f"</OfficerDirTrstKeyEmplInfoGrp><SupplementaryInformationGrp>{grant_groups}"
+        f"<TotalGrantOrContriPdDurYrAmt>{sum(amounts)}</TotalGrantOrContriPdDurYrAmt></SupplementaryInformationGrp></IRS990PF>"
+    )
+
+
+def filing(rng: random.Random, form_type: str, staff: int, grants: int) -> str:
+    ein = f"{rng.randint(10**8, 10**9 - 1)}"
+    year = rng.randint(2013, 2023)
+
+    if form_type == "990":
+        form = irs990(rng, staff)
+    elif form_type == "990EZ":
+        form = irs990ez(rng, staff)
+    else:
+        form = irs990pf(rng, staff, grants)
+
+    return (
+        f"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+        f"<Return xmlns=\"http://www.irs.gov/efile\" returnVersion=\"{year}v4.0\">"
+        f"{header(rng, form_type, ein, year)}<ReturnData documentCnt=\"1\">{form}</ReturnData></Return>\n"
+    )
+
+
+def generate_corpus(target_dir: pathlib.Path, files: int, seed: int = 0, staff: int = 10, grants: int = 100) -> int:
+    """
+    Writes files filings into target_dir and returns their total size in bytes.
+    staff and grants are the average number of Part VII / officer entries and of 990PF grants per filing.
+    """
+    rng = random.Random(seed)
+    total_size = 0
+
+    for number in range(files):
+        form_type = rng.choice(FORM_TYPES)
+        content = filing(rng, form_type, staff=rng.randint(0, 2 * staff), grants=rng.randint(0, 2 * grants))
+
+        directory = target_dir.joinpath(f"{number // FILES_PER_DIRECTORY:05d}")
+        directory.mkdir(parents=True, exist_ok=True)
+
+        encoded = content.encode("utf-8")
+        directory.joinpath(f"{number:08d}_public.xml").write_bytes(encoded)
+        total_size += len(encoded)
+
+    return total_size
+
+
+@click.command()
+@click.argument("target_dir", type=click.Path(file_okay=False, path_type=pathlib.Path))
+@click.option("--files", type=click.IntRange(min=1), default=1000, show_default=True, help="Number of filings to write")
+@click.option("--seed", type=int, default=0, show_default=True, help="Seed of the random generator, the same seed writes the same corpus")
+@click.option("--staff", type=click.IntRange(min=0), default=10, show_default=True, help="Average number of staff entries per filing")
+@click.option("--grants", type=click.IntRange(min=0), default=100, show_default=True, help="Average number of grants per 990PF filing")
+def main(target_dir: pathlib.Path, files: int, seed: int, staff: int, grants: int) -> None:
+    total_size = generate_corpus(target_dir, files=files, seed=seed, staff=staff, grants=grants)
+    print(f"Wrote {files} filings ({total_size / 2**20:.1f} MB) into {target_dir}")
+
+
+if __name__ == "__main__":
+    main()
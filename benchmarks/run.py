@@ -0,0 +1,214 @@
+#
+# Measures the throughput and the memory use of every table extractor and of a whole extractor run
+# on synthetic corpora of growing size, the results are saved as JSON so runs can be compared over time
+#
+
+import datetime
+import json
+import os
+import pathlib
+import platform
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks import generate
+
+DEFAULT_SIZES = "1000,100000,1000000"
+MAIN_TARGET = "__main__"
+
+
+def corpus_dir(work_dir: pathlib.Path, files: int, seed: int, staff: int, grants: int) -> pathlib.Path:
+    """
+    Generates the corpus once, later benchmark runs with the same parameters reuse it
+    """
+    target_dir = work_dir.joinpath(f"corpus-{files}-seed{seed}-staff{staff}-grants{grants}")
+    marker = target_dir.joinpath(".complete")
+
+    if not marker.exists():
+        print(f"Generating {files} filings into {target_dir}")
+        generate.generate_corpus(target_dir, files=files, seed=seed, staff=staff, grants=grants)
+        marker.touch()
+
+    return target_dir
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure_table(data_dir: pathlib.Path, table_name: str, engine: str) -> dict:
+    from extractor import pipeline, scanner, utils
+
+    table = pipeline.TABLES[table_name]
+    parse_xml_records = pipeline.ENGINES[engine]
+
+    started = time.perf_counter()
+    xml_files = scanner.scan_xml_entries(data_dir)
+
+    rows = 0
+    for xml_file in xml_files:
+        document, records = parse_xml_records(scanner.read_file(xml_file.path), table.RECORD_EXTRACTORS)
+        rows += sum(1 for _ in table.extract(utils.extract_file_type(document), document, records))
+
+    return {
+        "seconds": time.perf_counter() - started,
+        "files": len(xml_files),
+        "bytes": sum(xml_file.size for xml_file in xml_files),
+        "rows": rows,
+    }
+
+
+def measure_main(data_dir: pathlib.Path, main_args: list[str]) -> dict:
+    from extractor import scanner
+
+    xml_files = scanner.scan_xml_entries(data_dir)
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        # the extractor reads ./data and writes ./output
+        os.chdir(run_dir)
+        os.symlink(data_dir.resolve(), "data")
+        os.mkdir("output")
+
+        sys.argv = ["extractor", *main_args]
+        started = time.perf_counter()
+        try:
+            runpy.run_module("extractor", run_name="__main__")
+        except SystemExit as exit:
+            if exit.code:
+                raise
+
+        seconds = time.perf_counter() - started
+
+    return {
+        "seconds": seconds,
+        "files": len(xml_files),
+        "bytes": sum(xml_file.size for xml_file in xml_files),
+    }
+
+
+def run_measurement(data_dir: pathlib.Path, target: str, engine: str, main_args: str) -> dict:
+    """
+    Every measurement runs in a fresh process so its peak RSS is its own
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+        subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.run", "measure",
+                "--data", str(data_dir),
+                "--target", target,
+                "--engine", engine,
+                "--main-args", main_args,
+                "--result-file", result_file.name,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        result = json.loads(pathlib.Path(result_file.name).read_text())
+
+    result["files_per_s"] = result["files"] / result["seconds"]
+    result["mb_per_s"] = result["bytes"] / 2**20 / result["seconds"]
+    return result
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.option("--sizes", default=DEFAULT_SIZES, show_default=True, help="Comma separated corpus sizes (number of files)")
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--staff", type=click.IntRange(min=0), default=10, show_default=True, help="Average number of staff entries per filing")
+@click.option("--grants", type=click.IntRange(min=0), default=100, show_default=True, help="Average number of grants per 990PF filing")
+@click.option("--engine", default="minidom", show_default=True, help="Engine used by the per table measurements")
+@click.option("--main-args", default="", help="Arguments of the whole extractor run, e.g. \"--workers 8\"")
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    default=pathlib.Path("bench_data"),
+    show_default=True,
+    help="Where the generated corpora are kept",
+)
+@click.option(
+    "--results-dir",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    default=pathlib.Path("bench_results"),
+    show_default=True,
+)
+def run(
+    sizes: str,
+    seed: int,
+    staff: int,
+    grants: int,
+    engine: str,
+    main_args: str,
+    work_dir: pathlib.Path,
+    results_dir: pathlib.Path,
+) -> None:
+    from extractor import pipeline
+
+    results = []
+    for files in [int(size) for size in sizes.split(",")]:
+        data_dir = corpus_dir(work_dir, files=files, seed=seed, staff=staff, grants=grants)
+
+        for target in [*pipeline.TABLES, MAIN_TARGET]:
+            result = {"size": files, "target": target, **run_measurement(data_dir, target, engine, main_args)}
+            results.append(result)
+
+            print(
+                f"{files:>9} files {target:>14}: {result['files_per_s']:10.1f} files/s {result['mb_per_s']:8.2f} MB/s "
+                f"peak RSS {result['peak_rss_mb']:8.1f} MB"
+            )
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    summary = {
+        "created": created.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "staff": staff,
+        "grants": grants,
+        "engine": engine,
+        "main_args": main_args,
+        "results": results,
+    }
+
+    results_dir.mkdir(parents=True, exist_ok=True)
+    results_file = results_dir.joinpath(f"bench-{created:%Y%m%dT%H%M%SZ}.json")
+    results_file.write_text(json.dumps(summary, indent=2))
+    print(f"Results saved to {results_file}")
+
+
+@cli.command(hidden=True)
+@click.option("--data", "data_dir", type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path), required=True)
+@click.option("--target", required=True)
+@click.option("--engine", default="minidom")
+@click.option("--main-args", default="")
+@click.option("--result-file", type=click.Path(dir_okay=False, path_type=pathlib.Path), required=True)
+def measure(data_dir: pathlib.Path, target: str, engine: str, main_args: str, result_file: pathlib.Path) -> None:
+    data_dir = data_dir.resolve()
+    result_file = result_file.resolve()
+
+    if target == MAIN_TARGET:
+        result = measure_main(data_dir, main_args.split())
+    else:
+        result = measure_table(data_dir, target, engine)
+
+    result["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+    # worker processes of a --workers run
+    result["peak_child_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    result_file.write_text(json.dumps(result))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,14 @@
+import typing
+
+if typing.TYPE_CHECKING:
+    from extractor.api import Extraction
+
+
+def extract(paths, tables: typing.Iterable[str] | None = None, **options) -> "Extraction":
+    """
+    Extracts the tables from XML files, IRS archives or directories as lazy iterators of rows, see extractor.api.extract.
+    The parsers are only imported on the first call so importing the package stays cheap.
+    """
+    from extractor import api
+
+    return api.extract(paths, tables, **options)
@@ -1,15 +1,431 @@
+import csv
 import pathlib
+import sys
+import typing
 
-from extractor.organizations import main as organizations
-from extractor.accountants import main as accountants
-from extractor.staff import main as staff
-from extractor.beneficiaries import main as beneficiaries
+import click
 
-base_path = pathlib.Path("./data")
-output_path = pathlib.Path("./output")
+from extractor import catalog, checkpoint, lookup, pipeline, printer, scanner, shards, watch
 
-organizations.parse(base_path=base_path, output_file=output_path.joinpath("organizations.csv"))
-accountants.parse(base_path=base_path, output_file=output_path.joinpath("accountants.csv"))
-staff.parse(base_path=base_path, output_file=output_path.joinpath("staff.csv"))
-beneficiaries.parse(base_path=base_path, output_file=output_path.joinpath("beneficiaries.csv"))
 
+def parse_shard(ctx: click.Context, param: click.Parameter, value: str | None) -> shards.Shard | None:
+    if value is None:
+        return None
+
+    try:
+        return shards.parse_shard(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def parse_tables(ctx: click.Context, param: click.Parameter, value: str | None) -> tuple[str, ...] | None:
+    if value is None:
+        return None
+
+    table_names = tuple(table_name.strip() for table_name in value.split(",") if table_name.strip())
+    if not table_names:
+        raise click.BadParameter("Expected a comma separated list of tables")
+
+    return table_names
+
+
+data_option = click.option(
+    "--data",
+    "base_path",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    default="./data",
+    show_default=True,
+    help="Directory holding the XML files and IRS archives",
+)
+output_option = click.option(
+    "--out",
+    "output_path",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    default="./output",
+    show_default=True,
+    help="Directory the tables, manifest, catalog and reports are written into",
+)
+scan_workers_option = click.option(
+    "--scan-workers",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of threads listing directories, helps most on network storage",
+)
+file_index_option = click.option(
+    "--file-index",
+    is_flag=True,
+    help="Save the list of scanned files in the output directory and only list directories that changed since the last run",
+)
+tables_option = click.option(
+    "--tables",
+    callback=parse_tables,
+    help="Only extract and write these tables of the layout, comma separated (e.g. staff,beneficiaries)",
+)
+layout_option = click.option(
+    "--layout",
+    type=click.Choice(list(pipeline.LAYOUTS)),
+    default="denormalized",
+    show_default=True,
+    help="normalized writes the filer columns once into a filings table, the other tables refer to it by Filing ID",
+)
+ein_option = click.option("--ein", "eins", multiple=True, help="Only parse filings of this EIN, can be repeated")
+year_option = click.option("--year", "years", type=int, multiple=True, help="Only parse filings of this filing year, can be repeated")
+form_option = click.option(
+    "--form",
+    "forms",
+    type=click.Choice(["990", "990EZ", "990PF"]),
+    multiple=True,
+    help="Only parse filings of this form type, can be repeated",
+)
+
+RUN_OPTIONS = [
+    data_option,
+    output_option,
+    tables_option,
+    click.option(
+        "--workers",
+        type=click.IntRange(min=1),
+        default=1,
+        show_default=True,
+        help="Number of processes parsing files in parallel",
+    ),
+    click.option(
+        "--engine",
+        type=click.Choice(list(pipeline.ENGINES)),
+        default="minidom",
+        show_default=True,
+        help="XML parser, iterparse streams the repeated groups instead of building the whole document",
+    ),
+    click.option(
+        "--read-ahead",
+        type=click.IntRange(min=0),
+        default=pipeline.READ_AHEAD,
+        show_default=True,
+        help="Number of files read while the current ones are parsed, 0 reads every file only when it is parsed",
+    ),
+    click.option(
+        "--incremental",
+        is_flag=True,
+        help="Keep a manifest in the output directory and only parse files that are new or changed since the last run",
+    ),
+    click.option(
+        "--hash",
+        "use_hash",
+        is_flag=True,
+        help="With --incremental, also compare file contents so touched but unchanged files are not parsed again",
+    ),
+    click.option(
+        "--format",
+        "output_format",
+        type=click.Choice(list(printer.FORMATS)),
+        default="csv",
+        show_default=True,
+        help="Output format, parquet and arrow write a directory per table partitioned by filing year and form type, "
+        "sqlite writes every table into one database",
+    ),
+    scan_workers_option,
+    file_index_option,
+    ein_option,
+    click.option(
+        "--ein-file",
+        type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+        help="Only parse filings of the EINs listed in this file, one per line",
+    ),
+    year_option,
+    form_option,
+    layout_option,
+    click.option(
+        "--dedup",
+        "deduplicate",
+        is_flag=True,
+        help="Skip copies of the same file and keep only the latest (or amended) return per EIN, tax period and form",
+    ),
+    click.option(
+        "--resume",
+        is_flag=True,
+        help="Continue an interrupted csv run from its last checkpoint instead of starting from scratch",
+    ),
+    click.option(
+        "--shard",
+        callback=parse_shard,
+        help="Only parse the i-th of N slices of the files (e.g. 2/4) into output/shard-i-of-N, see the merge command",
+    ),
+]
+
+
+def run_options(function: typing.Callable) -> typing.Callable:
+    # the group and the run command take the same options, a bare invocation runs the extraction
+    for option in reversed(RUN_OPTIONS):
+        function = option(function)
+
+    return function
+
+
+@click.group(invoke_without_command=True)
+@run_options
+@click.pass_context
+def main(ctx: click.Context, **options) -> None:
+    """
+    Extracts tables from IRS 990 e-file XML returns, without a command the files are extracted as by run.
+    The run options only go before a command name when there is none.
+    """
+    if ctx.invoked_subcommand is None:
+        ctx.invoke(run, **options)
+        return
+
+    # the subcommand has its own options, the ones given before its name would be silently ignored
+    given = [
+        param.opts[0]
+        for param in ctx.command.params
+        if ctx.get_parameter_source(param.name) not in (click.core.ParameterSource.DEFAULT, None)
+    ]
+    if given:
+        raise click.UsageError(
+            f"Options before {ctx.invoked_subcommand} would be ignored ({', '.join(given)}), pass them after it instead", ctx=ctx
+        )
+
+
+@main.command("run")
+@run_options
+def run(
+    base_path: pathlib.Path,
+    output_path: pathlib.Path,
+    tables: tuple[str, ...] | None,
+    workers: int,
+    engine: str,
+    read_ahead: int,
+    incremental: bool,
+    use_hash: bool,
+    output_format: str,
+    scan_workers: int,
+    file_index: bool,
+    eins: tuple[str],
+    ein_file: pathlib.Path | None,
+    years: tuple[int],
+    forms: tuple[str],
+    layout: str,
+    deduplicate: bool,
+    resume: bool,
+    shard: shards.Shard | None,
+) -> None:
+    """
+    Parses the XML files of the data directory into the tables of the output directory
+    """
+    if resume and (incremental or output_format != "csv"):
+        raise click.UsageError("--resume only works for csv runs without --incremental, incremental runs resume by themselves")
+
+    try:
+        pipeline.select_outputs(layout, tables)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--tables")
+
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    all_eins = set(eins)
+    if ein_file is not None:
+        all_eins.update(line.strip() for line in ein_file.read_text().splitlines() if line.strip())
+
+    pipeline.run(
+        base_path=base_path,
+        output_path=output_path,
+        workers=workers,
+        engine=engine,
+        incremental=incremental,
+        use_hash=use_hash,
+        output_format=output_format,
+        scan_workers=scan_workers,
+        file_index=file_index,
+        eins=all_eins,
+        years=set(years),
+        forms=set(forms),
+        resume=resume,
+        layout=layout,
+        deduplicate=deduplicate,
+        read_ahead=read_ahead,
+        shard=shard,
+        tables=tables,
+    )
+
+
+@main.command()
+@data_option
+@output_option
+@scan_workers_option
+@file_index_option
+def scan(base_path: pathlib.Path, output_path: pathlib.Path, scan_workers: int, file_index: bool) -> None:
+    """
+    Lists the XML files a run would parse, in scan order, with their size
+    """
+    index_file = output_path.joinpath(scanner.INDEX_FILE) if file_index else None
+    if index_file is not None:
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    broken_archives: list[tuple[pathlib.Path, Exception]] = []
+    xml_files = scanner.scan_xml_entries(base_path, workers=scan_workers, index_file=index_file, failed=broken_archives)
+    for xml_file in xml_files:
+        click.echo(f"{xml_file.size}\t{xml_file.path}")
+
+    for archive_path, e in broken_archives:
+        click.echo(f"Skipped {archive_path}: {type(e).__name__}: {e}", err=True)
+
+    click.echo(f"{len(xml_files)} files, {sum(xml_file.size for xml_file in xml_files)} bytes", err=True)
+
+
+@main.command("catalog")
+@data_option
+@output_option
+@scan_workers_option
+@ein_option
+@year_option
+@form_option
+def catalog_command(
+    base_path: pathlib.Path,
+    output_path: pathlib.Path,
+    scan_workers: int,
+    eins: tuple[str],
+    years: tuple[int],
+    forms: tuple[str],
+) -> None:
+    """
+    Reads the headers of new or changed files into the catalog and prints the matching filings as csv
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    broken_archives: list[tuple[pathlib.Path, Exception]] = []
+    xml_files = scanner.scan_xml_entries(base_path, workers=scan_workers, failed=broken_archives)
+    with (
+        catalog.Catalog(output_path.joinpath(catalog.CATALOG_FILE), base_path=base_path) as filing_catalog,
+        checkpoint.Quarantine(output_path.joinpath(catalog.QUARANTINE_FILE)) as quarantine,
+    ):
+        unreadable = [(archive_path, checkpoint.file_error(e)) for archive_path, e in broken_archives]
+        filings = filing_catalog.update(xml_files, workers=scan_workers, failed=unreadable)
+
+        for file_path, file_error in unreadable:
+            quarantine.add(file_path, file_error)
+
+    if unreadable:
+        click.echo(f"{len(unreadable)} files could not be read, see {output_path.joinpath(catalog.QUARANTINE_FILE)}", err=True)
+
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(["Path", "EIN", "Filing Year", "Type", "Tax Period End", "Return Version", "Amended"])
+    for filing in filings:
+        if catalog.matches(filing, set(eins), set(years), set(forms)):
+            writer.writerow(
+                [
+                    pathlib.Path(filing.path).relative_to(base_path).as_posix(),
+                    filing.ein,
+                    filing.filing_year,
+                    filing.return_type,
+                    filing.tax_period_end,
+                    filing.return_version,
+                    int(filing.amended),
+                ]
+            )
+
+
+@main.command("watch")
+@data_option
+@output_option
+@tables_option
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(watch.WATCH_FORMATS),
+    default="csv",
+    show_default=True,
+    help="Output format, only csv and sqlite outputs can be appended to",
+)
+@layout_option
+@click.option("--workers", type=click.IntRange(min=1), default=1, show_default=True, help="Number of processes parsing files in parallel")
+@click.option("--engine", type=click.Choice(list(pipeline.ENGINES)), default="minidom", show_default=True, help="XML parser")
+@scan_workers_option
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0),
+    default=watch.POLL_INTERVAL,
+    show_default=True,
+    help="Seconds between two polls of the data directory",
+)
+@click.option(
+    "--skip-existing",
+    is_flag=True,
+    help="On the first start, leave the files already there (and the outputs of an earlier run) as they are and only "
+    "extract the files arriving from now on",
+)
+def watch_command(
+    base_path: pathlib.Path,
+    output_path: pathlib.Path,
+    tables: tuple[str, ...] | None,
+    output_format: str,
+    layout: str,
+    workers: int,
+    engine: str,
+    scan_workers: int,
+    interval: float,
+    skip_existing: bool,
+) -> None:
+    """
+    Keeps extracting the files arriving in the data directory and appends their rows to the outputs until interrupted
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    try:
+        watcher = watch.Watcher(
+            base_path,
+            output_path,
+            workers=workers,
+            engine=engine,
+            output_format=output_format,
+            layout=layout,
+            tables=tables,
+            scan_workers=scan_workers,
+            skip_existing=skip_existing,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    def report(new_files: list[scanner.ScannedFile]) -> None:
+        if new_files:
+            click.echo(f"{len(new_files)} new files, {watcher.state.files} since the start", err=True)
+
+    click.echo(f"Watching {base_path} every {interval}s", err=True)
+    try:
+        watch.watch(watcher, interval=interval, on_poll=report)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command()
+@output_option
+@click.option(
+    "--shards",
+    "shard_count",
+    type=click.IntRange(min=1),
+    required=True,
+    help="Number of shards the run was split into, all of output/shard-i-of-N must be there",
+)
+def merge(output_path: pathlib.Path, shard_count: int) -> None:
+    """
+    Merges the csv outputs of sharded runs into the tables of a single machine run, in the same row order
+    """
+    try:
+        shards.merge(output_path, shard_count)
+    except (FileNotFoundError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+
+@main.command()
+@output_option
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to listen on")
+@click.option("--port", type=click.IntRange(min=1, max=65535), default=lookup.DEFAULT_PORT, show_default=True, help="Port to listen on")
+def serve(output_path: pathlib.Path, host: str, port: int) -> None:
+    """
+    Answers GET /ein/<EIN> with the rows of every csv table in the output directory, indexes are built when missing or stale
+    """
+    click.echo(f"Serving {output_path} on http://{host}:{port}/ein/<EIN>", err=True)
+    lookup.serve(output_path, host=host, port=port)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,9 @@
 # Extract the files to create several CSV files
 #
 
-from datetime import datetime, date
-import pathlib
-import typing
-from xml.dom.minidom import parse, Document
+from xml.dom.minidom import Document
 
-from extractor import utils
+from extractor import plans
 
 # set the names for the constants which are used to hold extracted data xmls and properly arrange them
 FILING_YEAR = "Filing Year"
@@ -33,107 +30,75 @@ BOOKS_PHONE = "the books are in care of: Telephone" # 990 PF specifc
 BOOKS_ADDRESS = "the books are in care of: Address" # 990 PF specifc
 BOOKS_ZIPCODE = "the books are in care of: Zip Code" # 990 PF specifc
 
+# output columns in the order they are written, rows of every form type share this header
+COLUMNS = [
+    FILING_YEAR, FORM_TYPE, CHARITY_EIN, PHONE, BUSINESS_NAME, CITY_OR_TOWN, ZIPCODE, STATE_OR_PROVINCE, COUNTRY, ADDRESS1,
+    PREP_FIRM_EIN, PREP_FIRM_NAME, PREP_FIRM_ADDRESS, PREP_FIRM_CITY, PREP_FIRM_STATE, PREP_FIRM_ZIPCODE,
+    BOOKS_NAME, BOOKS_PHONE, BOOKS_ADDRESS, BOOKS_ZIPCODE,
+]
 
-def extract_common_data(dom: Document) -> dict[str, str] | None:
-    data = {}
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    header_element = utils.extract_single_tag(return_element, "ReturnHeader")
 
+# fields every form type has, read from the return header
+COMMON_FIELDS = [
     # Get the filing year
-    tax_period_begin_text = utils.extract_single_tag_value(header_element, "TaxPeriodBeginDt")
-    tax_period_begin: date = datetime.strptime(tax_period_begin_text, "%Y-%m-%d")
-    data[FILING_YEAR] = tax_period_begin.year
-
+    plans.Field(FILING_YEAR, f"{plans.HEADER_PATH}/TaxPeriodBeginDt", convert=plans.filing_year),
     # get file type
-    form_type = utils.extract_single_tag_value(header_element, "ReturnTypeCd")
-    data[FORM_TYPE] = form_type
-
-    filer_element = utils.extract_single_tag(header_element, "Filer")
-
+    plans.Field(FORM_TYPE, f"{plans.HEADER_PATH}/ReturnTypeCd"),
     # Get filer EIN and phone number
-    charity_ein = utils.extract_single_tag_value(filer_element, "EIN")
-    phonenumber = utils.extract_single_tag_value(filer_element, "PhoneNum", optional=True)
-    data[CHARITY_EIN] = charity_ein
-    data[PHONE] = phonenumber
-
+    plans.Field(CHARITY_EIN, f"{plans.FILER_PATH}/EIN"),
+    plans.Field(PHONE, f"{plans.FILER_PATH}/PhoneNum", optional=True),
     # Get filer business name
-    business_name_element = utils.extract_single_tag(filer_element, "BusinessName")
-    business_name = utils.extract_single_tag_value(business_name_element, "BusinessNameLine1Txt")
-    data[BUSINESS_NAME] = business_name
-
-    # find address section and step into it
-    us_address_element = utils.extract_single_tag(filer_element, "USAddress")
-
-    # find the filer city/town
-    city_or_town = utils.extract_single_tag_value(us_address_element, "CityNm")
-    # find the filer zipcode
-    zipcode = utils.extract_single_tag_value(us_address_element, "ZIPCd")
-    # find the filer state/province
-    state_or_province = utils.extract_single_tag_value(us_address_element, "StateAbbreviationCd")
-    address1 = utils.extract_single_tag_value(us_address_element, "AddressLine1Txt")
-    
-    data[CITY_OR_TOWN] = city_or_town
-    data[ZIPCODE] = zipcode
-    data[STATE_OR_PROVINCE] = state_or_province
-    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found 
-    data[ADDRESS1] = address1
-    
-    # getting accounting firm specific information
-    preparer_firm_element = utils.extract_single_tag(header_element, "PreparerFirmGrp", optional=True)
-    if preparer_firm_element is None:
+    plans.Field(BUSINESS_NAME, f"{plans.FILER_PATH}/BusinessName/BusinessNameLine1Txt"),
+    # filer address
+    plans.Field(CITY_OR_TOWN, f"{plans.FILER_ADDRESS_PATH}/CityNm"),
+    plans.Field(ZIPCODE, f"{plans.FILER_ADDRESS_PATH}/ZIPCd"),
+    plans.Field(STATE_OR_PROVINCE, f"{plans.FILER_ADDRESS_PATH}/StateAbbreviationCd"),
+    plans.Field(ADDRESS1, f"{plans.FILER_ADDRESS_PATH}/AddressLine1Txt"),
+]
+
+# getting accounting firm specific information, filings without a preparer firm give no row
+PREPARER_FIRM_PATH = f"{plans.HEADER_PATH}/PreparerFirmGrp"
+PREPARER_FIELDS = [
+    plans.Field(PREP_FIRM_EIN, f"{PREPARER_FIRM_PATH}/PreparerFirmEIN", optional=True),
+    plans.Field(PREP_FIRM_NAME, f"{PREPARER_FIRM_PATH}/PreparerFirmName/BusinessNameLine1Txt"),
+    plans.Field(PREP_FIRM_ADDRESS, f"{PREPARER_FIRM_PATH}/PreparerUSAddress/AddressLine1Txt"),
+    plans.Field(PREP_FIRM_CITY, f"{PREPARER_FIRM_PATH}/PreparerUSAddress/CityNm"),
+    plans.Field(PREP_FIRM_STATE, f"{PREPARER_FIRM_PATH}/PreparerUSAddress/StateAbbreviationCd"),
+    plans.Field(PREP_FIRM_ZIPCODE, f"{PREPARER_FIRM_PATH}/PreparerUSAddress/ZIPCd"),
+]
+
+# who keeps the books, 990PF filings without it give no row
+IRS990PF_PATH = f"{plans.RETURN_DATA_PATH}/IRS990PF"
+BOOKS_NAME_PATH = f"{IRS990PF_PATH}/PersonsWithBooksName"
+BOOKS_FIELDS_990PF = [
+    plans.Field(BOOKS_NAME, f"{BOOKS_NAME_PATH}/BusinessNameLine1Txt"),
+    plans.Field(BOOKS_PHONE, f"{IRS990PF_PATH}/PhoneNum"),
+    plans.Field(BOOKS_ADDRESS, f"{IRS990PF_PATH}/LocationOfBooksUSAddress/AddressLine1Txt"), # add city and state?
+    plans.Field(BOOKS_ZIPCODE, f"{IRS990PF_PATH}/LocationOfBooksUSAddress/ZIPCd"),
+]
+
+# compiled once per form type, a single walk of the document fills the whole row
+PLAN = plans.compile_plan([*COMMON_FIELDS, *PREPARER_FIELDS], guards=[PREPARER_FIRM_PATH])
+PLAN_990PF = plans.compile_plan([*COMMON_FIELDS, *PREPARER_FIELDS, *BOOKS_FIELDS_990PF], guards=[PREPARER_FIRM_PATH, BOOKS_NAME_PATH])
+
+
+def extract_data(plan: plans.Plan, dom: Document) -> dict[str, str] | None:
+    data = plans.run_plan(plan, dom)
+    if data is None:
         return None
-    
-    preparer_firm_name_element = utils.extract_single_tag(preparer_firm_element, "PreparerFirmName")
-    preparer_firm_address_element = utils.extract_single_tag(preparer_firm_element, "PreparerUSAddress")
-
-    preparer_firm_ein = utils.extract_single_tag_value(preparer_firm_element, "PreparerFirmEIN", optional=True)
-    preparer_firm_name = utils.extract_single_tag_value(preparer_firm_name_element, "BusinessNameLine1Txt")
-    preparer_firm_address = utils.extract_single_tag_value(preparer_firm_address_element, "AddressLine1Txt")
-    prepare_firm_city = utils.extract_single_tag_value(preparer_firm_address_element, "CityNm")
-    prepare_firm_state = utils.extract_single_tag_value(preparer_firm_address_element, "StateAbbreviationCd")
-    prepare_firm_zipcode = utils.extract_single_tag_value(preparer_firm_address_element, "ZIPCd")
-
-    data[PREP_FIRM_EIN] = preparer_firm_ein
-    data[PREP_FIRM_NAME] = preparer_firm_name
-    data[PREP_FIRM_ADDRESS] = preparer_firm_address
-    data[PREP_FIRM_CITY] = prepare_firm_city
-    data[PREP_FIRM_STATE] = prepare_firm_state
-    data[PREP_FIRM_ZIPCODE] = prepare_firm_zipcode
+
+    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found
 
     return data
 
 
 def extract_data_990(dom: Document) -> dict[str, str] | None:
-    data = extract_common_data(dom)
-    return data
+    return extract_data(PLAN, dom)
 
 
 def extract_data_990EZ(dom: Document) -> dict[str, str] | None:
-    data = extract_common_data(dom)
-    return data
-
+    return extract_data(PLAN, dom)
 
-def extract_data_990PF(dom: Document) -> dict[str, str] | None:     
-    data = extract_common_data(dom)
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    data_element = utils.extract_single_tag(return_element, "ReturnData")
-    irs990PF_element = utils.extract_single_tag(data_element, "IRS990PF")
-    books_name_element = utils.extract_single_tag(irs990PF_element, "PersonsWithBooksName", optional=True)
-    if books_name_element is None:
-        return None
-    
-    books_location_element = utils.extract_single_tag(irs990PF_element, "LocationOfBooksUSAddress")
 
-    books_name = utils.extract_single_tag_value(books_name_element, "BusinessNameLine1Txt")
-    books_phone = utils.extract_single_tag_value(irs990PF_element, "PhoneNum")
-    books_address = utils.extract_single_tag_value(books_location_element, "AddressLine1Txt") # add city and state?
-    books_zipcode = utils.extract_single_tag_value(books_location_element, "ZIPCd")
-
-    data[BOOKS_NAME] = books_name
-    data[BOOKS_PHONE] = books_phone
-    data[BOOKS_ADDRESS] = books_address
-    data[BOOKS_ZIPCODE] = books_zipcode
-
-    return data
+def extract_data_990PF(dom: Document) -> dict[str, str] | None:
+    return extract_data(PLAN_990PF, dom)
@@ -0,0 +1,130 @@
+import collections
+import os
+import pathlib
+import typing
+
+from extractor import pipeline, scanner
+
+Row = dict[str, typing.Any]
+
+
+class Extraction:
+    """
+    The rows of every selected table, extracted lazily: files are only parsed while the rows are iterated.
+    All the tables come from a single pass over the files, the rows of the tables not being iterated are
+    buffered until they are, so iterate the tables side by side (or one after the other at the cost of memory).
+    """
+
+    def __init__(self, files: typing.Iterator[dict[str, list[Row]]], outputs: dict[str, pipeline.Output]):
+        self.files = files
+        self.outputs = outputs
+        self.buffers: dict[str, collections.deque[Row]] = {table_name: collections.deque() for table_name in outputs}
+
+    @property
+    def tables(self) -> list[str]:
+        return list(self.outputs)
+
+    def columns(self, table_name: str) -> list[str]:
+        return self.outputs[table_name].columns
+
+    def rows(self, table_name: str) -> typing.Generator[Row, None, None]:
+        """
+        Yields the rows of a table in file order, every column is present, missing values are None
+        """
+        buffer = self.buffers[table_name]
+        while True:
+            while buffer:
+                yield buffer.popleft()
+
+            file_rows = next(self.files, None)
+            if file_rows is None:
+                return
+
+            for output_name, output_rows in file_rows.items():
+                self.buffers[output_name].extend(output_rows)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.outputs)
+
+    def __getitem__(self, table_name: str) -> typing.Generator[Row, None, None]:
+        return self.rows(table_name)
+
+    def to_pandas(self, table_name: str):
+        """
+        Returns the rest of the rows of a table as a pandas DataFrame
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("pandas is required for to_pandas, install it with: pip install pandas")
+
+        return pandas.DataFrame(list(self.rows(table_name)), columns=self.columns(table_name))
+
+    def to_arrow(self, table_name: str):
+        """
+        Returns the rest of the rows of a table as a pyarrow Table, the column types are inferred from the values
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow is required for to_arrow, install it with: pip install pyarrow")
+
+        rows = list(self.rows(table_name))
+        return pyarrow.table({column: [row[column] for row in rows] for column in self.columns(table_name)})
+
+
+def extract(
+    paths: str | os.PathLike | typing.Iterable[str | os.PathLike],
+    tables: typing.Iterable[str] | None = None,
+    layout: str = "denormalized",
+    workers: int = 1,
+    engine: str = "minidom",
+) -> Extraction:
+    """
+    Extracts the tables of the layout (all of them without tables) from XML files, IRS archives
+    or directories holding them, the extractors of the other tables are skipped.
+    Nothing is read before the rows are iterated.
+    Raises ValueError for an unknown layout, table or engine, RuntimeError while iterating when a file fails.
+    """
+    if layout not in pipeline.LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {', '.join(pipeline.LAYOUTS)}")
+    if engine not in pipeline.ENGINES:
+        raise ValueError(f"Unknown engine {engine}, expected one of {', '.join(pipeline.ENGINES)}")
+
+    outputs = pipeline.select_outputs(layout, tables)
+
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    return Extraction(_extract_rows([pathlib.Path(path) for path in paths], outputs, workers, engine), outputs)
+
+
+def _extract_rows(
+    paths: list[pathlib.Path], outputs: dict[str, pipeline.Output], workers: int, engine: str
+) -> typing.Generator[dict[str, list[Row]], None, None]:
+    # the filing id of a file in a given directory is its filing id in a run over that directory
+    base_paths = {}
+    xml_files = []
+    for path in paths:
+        base_path = path if path.is_dir() else path.parent
+        for xml_file in _scan(path):
+            base_paths[xml_file.path] = base_path
+            xml_files.append(xml_file)
+
+    extracted = pipeline.extract_files(xml_files, workers=workers, engine=engine, table_names=pipeline.required_tables(outputs))
+    for xml_file, rows in extracted:
+        output_rows = pipeline.layout_rows(outputs, rows, pipeline.filing_id(xml_file.path, base_paths[xml_file.path]))
+        yield {
+            output_name: [{column: row.get(column) for column in outputs[output_name].columns} for row in table_rows]
+            for output_name, table_rows in output_rows.items()
+        }
+
+
+def _scan(path: pathlib.Path) -> list[scanner.ScannedFile]:
+    if path.is_dir():
+        return scanner.scan_xml_entries(path)
+
+    if path.suffix == scanner.ARCHIVE_SUFFIX:
+        return scanner.scan_archive_entries(path)
+
+    return [scanner.ScannedFile(path, *scanner.file_stat(path))]
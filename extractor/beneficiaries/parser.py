@@ -4,12 +4,10 @@
 # Extract the files to create several CSV files
 #
 
-from datetime import datetime, date
-import pathlib
 import typing
-from xml.dom.minidom import parse, Document
+from xml.dom.minidom import Document
 
-from extractor import utils
+from extractor import schemas, utils
 
 # set the names for the constants which are used to hold extracted data xmls and properly arrange them
 FILING_YEAR = "Filing Year"
@@ -21,93 +19,85 @@ ZIPCODE = "Zip Code"
 FORM_TYPE = "Type"
 COUNTRY = "Country"
 ADDRESS1 = "Address 1"  # changed from Number and Street (some provided only a PO Box)
-
-def extract_common_data(dom: Document) -> dict[str, str] | None:
-    data = {}
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    header_element = utils.extract_single_tag(return_element, "ReturnHeader")
-    filer_element = utils.extract_single_tag(header_element, "Filer")
-
-    # Get the filing year
-    tax_period_begin_text = utils.extract_single_tag_value(header_element, "TaxPeriodBeginDt")
-    tax_period_begin: date = datetime.strptime(tax_period_begin_text, "%Y-%m-%d")
-    data[FILING_YEAR] = tax_period_begin.year
-
-    # get file type
-    data[FORM_TYPE] = utils.extract_single_tag_value(header_element, "ReturnTypeCd")
-
-    # Get Charity EIN
-    data[CHARITY_EIN] = utils.extract_single_tag_value(filer_element, "EIN")
-
-    # Get filer business name
-    business_name_element = utils.extract_single_tag(filer_element, "BusinessName")
-    data[BUSINESS_NAME] = utils.extract_single_tag_value(business_name_element, "BusinessNameLine1Txt")
-
-    # find address section and step into it
-    us_address_element = utils.extract_single_tag(filer_element, "USAddress")
-
-    # find the filer city/town
-    data[CITY_OR_TOWN] = utils.extract_single_tag_value(us_address_element, "CityNm")
-
-    # find the filer zipcode
-    data[ZIPCODE] = utils.extract_single_tag_value(us_address_element, "ZIPCd")
-
-    # find the filer state/province
-    data[STATE_OR_PROVINCE] = utils.extract_single_tag_value(us_address_element, "StateAbbreviationCd")
-
-    # find the filer address
-    data[ADDRESS1] = utils.extract_single_tag_value(us_address_element, "AddressLine1Txt")
-
-    # set the filer address to US
-    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found 
-
-    return data
-
-
-def extract_grantees_info(dom: Document, common_data: dict) -> list[dict[str, str]]:
-    records = []
-    
-    grantee_elements = utils.extract_tag_instances(dom, "GrantOrContributionPdDurYrGrp")
-    
-    for grantee_element in grantee_elements:
-        # Create a new record for this contractor and fill in common data
-        grantee_data = {**common_data}
-        
-
-        grantee_name_element = utils.extract_single_tag(grantee_element, "RecipientBusinessName", optional=True)
-        if not grantee_name_element:
-            grantee_data["Grantee Name"] = utils.extract_single_tag_value(grantee_element,"RecipientPersonNm", optional=True)
-            if not grantee_name_element:
-                continue
-        grantee_data["Grantee Name"] = utils.extract_single_tag_value(grantee_name_element, "BusinessNameLine1Txt")
-
-        # Look for US address first
-        grantee_address_element = utils.extract_single_tag(grantee_element, "RecipientUSAddress", optional=True)
-        if not grantee_address_element:
-            # Check if we have a foreign address
-            grantee_address_element = utils.extract_single_tag(grantee_element, "RecipientForeignAddress", optional=True)
-            if not grantee_address_element:
-                # No address found!
-                continue
-
-        grantee_data["Grantee Address"] = utils.format_address(grantee_address_element)
-
-        grantee_data["Foundation Status"] = utils.extract_single_tag_value(grantee_element, "RecipientFoundationStatusTxt", optional=True)
-        grantee_data["Purpose of Grant"] = utils.extract_single_tag_value(grantee_element, "GrantOrContributionPurposeTxt")
-        grantee_data["Grant Amount"] = utils.extract_single_tag_value(grantee_element, "Amt")
-
-        # The grand total is in the parent node
-        grantee_data["Total Amount"] = utils.extract_single_tag_value(grantee_element.parentNode, "TotalGrantOrContriPdDurYrAmt")
-
-        records.append(grantee_data)
-
-    return records
-
-
-def extract_beneficiary_data(dom: Document) -> list[dict[str, str]] | None:
-    common_data = extract_common_data(dom)
-
-    beneficiaries = extract_grantees_info(dom=dom, common_data=common_data)
-
-    return [*beneficiaries]
+GRANTEE_NAME = "Grantee Name"
+GRANTEE_ADDRESS = "Grantee Address"
+FOUNDATION_STATUS = "Foundation Status"
+GRANT_PURPOSE = "Purpose of Grant"
+GRANT_AMOUNT = "Grant Amount"
+TOTAL_AMOUNT = "Total Amount"
+
+# output columns in the order they are written
+COLUMNS = [
+    FILING_YEAR, FORM_TYPE, CHARITY_EIN, BUSINESS_NAME, CITY_OR_TOWN, ZIPCODE, STATE_OR_PROVINCE, ADDRESS1, COUNTRY,
+    GRANTEE_NAME, GRANTEE_ADDRESS, FOUNDATION_STATUS, GRANT_PURPOSE, GRANT_AMOUNT, TOTAL_AMOUNT,
+]
+# columns of the grant itself, the rest are the filer columns joined from the filings table
+CHILD_COLUMNS = [GRANTEE_NAME, GRANTEE_ADDRESS, FOUNDATION_STATUS, GRANT_PURPOSE, GRANT_AMOUNT, TOTAL_AMOUNT]
+
+
+def extract_grantee_info(grantee_element: Document, schema: int) -> dict[str, str] | None:
+    grantee_data = {}
+
+    grantee_name_element = utils.extract_single_tag(grantee_element, schemas.tag_name("RecipientBusinessName", schema), optional=True)
+    if grantee_name_element is None:
+        grantee_data[GRANTEE_NAME] = utils.extract_single_tag_value(
+            grantee_element, schemas.tag_name("RecipientPersonNm", schema), optional=True
+        )
+        if grantee_name_element is None:
+            return None
+    grantee_data[GRANTEE_NAME] = utils.extract_single_tag_value(grantee_name_element, schemas.tag_name("BusinessNameLine1Txt", schema))
+
+    # Look for US address first
+    grantee_address_element = utils.extract_single_tag(grantee_element, schemas.tag_name("RecipientUSAddress", schema), optional=True)
+    if grantee_address_element is None:
+        # Check if we have a foreign address
+        grantee_address_element = utils.extract_single_tag(
+            grantee_element, schemas.tag_name("RecipientForeignAddress", schema), optional=True
+        )
+        if grantee_address_element is None:
+            # No address found!
+            return None
+
+    grantee_data[GRANTEE_ADDRESS] = utils.format_address(grantee_address_element, schema)
+
+    grantee_data[FOUNDATION_STATUS] = utils.extract_single_tag_value(
+        grantee_element, schemas.tag_name("RecipientFoundationStatusTxt", schema), optional=True
+    )
+    grantee_data[GRANT_PURPOSE] = utils.extract_single_tag_value(grantee_element, schemas.tag_name("GrantOrContributionPurposeTxt", schema))
+    grantee_data[GRANT_AMOUNT] = utils.extract_single_tag_value(grantee_element, schemas.tag_name("Amt", schema))
+
+    return grantee_data
+
+
+# every grant becomes one row, they can be extracted while the file is still being read
+RECORD_EXTRACTORS: dict[str, utils.RecordExtractor] = {
+    "GrantOrContributionPdDurYrGrp": extract_grantee_info,
+}
+
+
+def extract_grantees_info(records: utils.Records, schema: int) -> typing.Generator[dict[str, str], None, None]:
+    total_tag = schemas.tag_name("TotalGrantOrContriPdDurYrAmt", schema)
+
+    grants_element = None
+    total_amount = None
+    for parent_element, grantee_data in records["GrantOrContributionPdDurYrGrp"]:
+        # The grand total is in the parent node, read once for all the grants listed under it
+        # (records come in document order so the grants of a parent are next to each other)
+        if parent_element is not grants_element:
+            grants_element = parent_element
+            total_amount = utils.extract_single_tag_value(grants_element, total_tag)
+
+        # the record is only used for this row, it is completed in place instead of copied
+        grantee_data[TOTAL_AMOUNT] = total_amount
+
+        yield grantee_data
+
+
+def extract_beneficiary_data(dom: Document, records: utils.Records | None = None) -> typing.Iterator[dict[str, str]]:
+    """
+    Yields the grant columns of every grant, the filer columns (common data) are joined in when the rows are written
+    """
+    if records is None:
+        records = utils.collect_records(dom, RECORD_EXTRACTORS)
+
+    return extract_grantees_info(records=records, schema=utils.extract_schema(dom))
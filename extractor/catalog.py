@@ -0,0 +1,284 @@
+import concurrent.futures
+import pathlib
+import sqlite3
+import traceback
+import typing
+from xml.etree import ElementTree
+
+from extractor import checkpoint, manifest, scanner, schemas
+
+CATALOG_FILE = "catalog.sqlite"
+# files whose header could not be read by the catalog command
+QUARANTINE_FILE = "catalog-quarantine.jsonl"
+
+# bumped when the columns change, a catalog of another version is emptied and every header is read again
+CATALOG_VERSION = 3
+
+# bytes fed to the parser at a time, the header of a filing normally fits in the first chunk
+CHUNK_SIZE = 16 * 1024
+
+# header values kept in the catalog, keyed by their path under the Return element
+HEADER_PATHS = {
+    ("ReturnHeader", "Filer", "EIN"): "ein",
+    ("ReturnHeader", "ReturnTypeCd"): "return_type",
+    ("ReturnHeader", "TaxPeriodBeginDt"): "tax_period_begin",
+    ("ReturnHeader", "TaxPeriodEndDt"): "tax_period_end",
+    ("ReturnHeader", "ReturnTs"): "timestamp",
+}
+# the same values under the tag names of the older schemas
+HEADER_PATHS.update(
+    {
+        tuple(schemas.tag_name(tag_name, schema) for tag_name in path): key
+        for schema in range(1, len(schemas.TAG_OVERRIDES) + 1)
+        for path, key in HEADER_PATHS.items()
+    }
+)
+
+# indicator values of a checked box
+CHECKED = {"X", "x", "true", "1"}
+
+# header values without which a filing can be neither filtered nor deduplicated, with their names in the reports
+REQUIRED_VALUES = {"ein": "EIN", "filing_year": "filing year", "return_type": "return type"}
+
+
+class Filing(typing.NamedTuple):
+    path: pathlib.Path
+    size: int
+    mtime_ns: int
+    ein: str | None
+    return_type: str | None
+    tax_period_begin: str | None
+    return_version: str | None
+    tax_period_end: str | None
+    timestamp: str | None
+    amended: bool
+    hash: str | None = None
+
+    @property
+    def filing_year(self) -> int | None:
+        # same year as the Filing Year column of the outputs
+        return int(self.tax_period_begin[:4]) if self.tax_period_begin else None
+
+    @property
+    def file(self) -> scanner.ScannedFile:
+        return scanner.ScannedFile(self.path, self.size, self.mtime_ns)
+
+
+def read_header(xml_file: scanner.ScannedFile) -> Filing:
+    """
+    Reads only the beginning of the file, parsing stops once the ReturnHeader element and the indicators
+    at the top of the form (AmendedReturnInd among them) have been read.
+    Raises ElementTree.ParseError when the file ends before that and ValueError when the header lacks
+    one of the REQUIRED_VALUES.
+    """
+    values: dict[str, typing.Any] = dict.fromkeys([*HEADER_PATHS.values(), "return_version"])
+    values["amended"] = False
+
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    path: list[str] = []
+
+    with scanner.open_file(xml_file.path) as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parser.feed(chunk)
+
+            for event, element in parser.read_events():
+                tag_name = element.tag.rpartition("}")[2]
+
+                if event == "start":
+                    if not path:
+                        values["return_version"] = element.get("returnVersion")
+                    path.append(tag_name)
+                    continue
+
+                key = HEADER_PATHS.get(tuple(path[1:]))
+                if key is not None:
+                    values[key] = element.text
+
+                # Return/ReturnData/IRS990/AmendedReturnInd, the form starts with its check boxes
+                is_form_field = len(path) == 4 and path[1] == "ReturnData"
+                if is_form_field and tag_name == "AmendedReturnInd":
+                    values["amended"] = element.text in CHECKED
+
+                path.pop()
+                if (is_form_field and not tag_name.endswith("Ind")) or tag_name == "ReturnData":
+                    return _checked(Filing(xml_file.path, xml_file.size, xml_file.mtime_ns, **values))
+
+    # an empty or truncated file raises here, the parser only reports a missing end once it is closed
+    parser.close()
+
+    return _checked(Filing(xml_file.path, xml_file.size, xml_file.mtime_ns, **values))
+
+
+def _checked(filing: Filing) -> Filing:
+    missing = [name for key, name in REQUIRED_VALUES.items() if not getattr(filing, key)]
+    if missing:
+        raise ValueError(f"No {', '.join(missing)} in the header")
+
+    return filing
+
+
+class Catalog:
+    """
+    Table of the header values of every scanned file, files that did not change keep their row between runs
+    """
+
+    def __init__(self, catalog_file: pathlib.Path, base_path: pathlib.Path):
+        self.base_path = base_path
+
+        self.connection = sqlite3.connect(catalog_file)
+
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != CATALOG_VERSION:
+            self.connection.executescript(
+                f"""
+                DROP TABLE IF EXISTS filings;
+                PRAGMA user_version = {CATALOG_VERSION};
+                """
+            )
+
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS filings (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ein TEXT,
+                return_type TEXT,
+                tax_period_begin TEXT,
+                filing_year INTEGER,
+                return_version TEXT,
+                tax_period_end TEXT,
+                timestamp TEXT,
+                amended INTEGER NOT NULL,
+                hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS filings_ein ON filings (ein);
+            CREATE INDEX IF NOT EXISTS filings_year_type ON filings (filing_year, return_type);
+            """
+        )
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def key(self, file_path: pathlib.Path) -> str:
+        return pathlib.Path(file_path).relative_to(self.base_path).as_posix()
+
+    def update(
+        self,
+        xml_files: list[scanner.ScannedFile],
+        workers: int = 8,
+        use_hash: bool = False,
+        failed: list[tuple[pathlib.Path, checkpoint.FileError]] | None = None,
+    ) -> list[Filing]:
+        """
+        Returns the catalog rows of xml_files, only new or changed files have their header read.
+        With use_hash the content hash of every file is filled in as well, it is kept until the file changes.
+        With failed a file whose header can not be read is appended there and left out instead of stopping the update,
+        it gets no row and is read again by the next update.
+        """
+        known = {
+            path: (size, mtime_ns, *header, bool(amended), file_hash)
+            for path, size, mtime_ns, *header, amended, file_hash in self.connection.execute(
+                "SELECT path, size, mtime_ns, ein, return_type, tax_period_begin, return_version, tax_period_end, timestamp,"
+                " amended, hash FROM filings"
+            )
+        }
+
+        filings: list[Filing | None] = []
+        unknown: list[tuple[int, scanner.ScannedFile]] = []
+        for xml_file in xml_files:
+            row = known.get(self.key(xml_file.path))
+            if row is not None and row[:2] == (xml_file.size, xml_file.mtime_ns) and (row[-1] is not None or not use_hash):
+                filings.append(Filing(xml_file.path, *row))
+            else:
+                unknown.append((len(filings), xml_file))
+                filings.append(None)
+
+        # header reads are mostly waiting on the storage, a thread pool keeps several in flight
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            headers = executor.map(_read_filing_isolated, [xml_file for _, xml_file in unknown], [use_hash] * len(unknown))
+            for (position, xml_file), (filing, file_error) in zip(unknown, headers):
+                if file_error is not None:
+                    if failed is None:
+                        raise RuntimeError(f"Failed to read the header of {xml_file.path}\n{file_error.traceback}")
+
+                    failed.append((xml_file.path, file_error))
+
+                filings[position] = filing
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.key(filing.path),
+                    filing.size,
+                    filing.mtime_ns,
+                    filing.ein,
+                    filing.return_type,
+                    filing.tax_period_begin,
+                    filing.filing_year,
+                    filing.return_version,
+                    filing.tax_period_end,
+                    filing.timestamp,
+                    filing.amended,
+                    filing.hash,
+                )
+                for filing in (filings[position] for position, _ in unknown)
+                if filing is not None
+            ],
+        )
+
+        present = {self.key(xml_file.path) for xml_file in xml_files}
+        missing = [(path,) for path in known if path not in present]
+        self.connection.executemany("DELETE FROM filings WHERE path = ?", missing)
+        self.connection.commit()
+
+        return [filing for filing in filings if filing is not None]
+
+
+def _read_filing(xml_file: scanner.ScannedFile, use_hash: bool) -> Filing:
+    filing = read_header(xml_file)
+    if use_hash:
+        filing = filing._replace(hash=manifest.hash_file(xml_file.path))
+
+    return filing
+
+
+def _read_filing_isolated(xml_file: scanner.ScannedFile, use_hash: bool) -> tuple[Filing | None, checkpoint.FileError | None]:
+    # a malformed or unreadable file must not take the other headers down with it
+    try:
+        return _read_filing(xml_file, use_hash), None
+    except (ElementTree.ParseError, OSError, ValueError) as e:
+        return None, checkpoint.FileError(type(e).__name__, str(e), traceback.format_exc())
+
+
+def matches(filing: Filing, eins: set[str], years: set[int], forms: set[str]) -> bool:
+    """
+    An empty filter lets everything through
+    """
+    if eins and filing.ein not in eins:
+        return False
+
+    if years and filing.filing_year not in years:
+        return False
+
+    if forms and filing.return_type not in forms:
+        return False
+
+    return True
+
+
+def select_files(
+    filings: list[Filing],
+    eins: set[str],
+    years: set[int],
+    forms: set[str],
+) -> list[scanner.ScannedFile]:
+    """
+    Keeps only the files matching the filters, in scan order
+    """
+    return [filing.file for filing in filings if matches(filing, eins, years, forms)]
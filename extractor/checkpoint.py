@@ -0,0 +1,133 @@
+import hashlib
+import json
+import pathlib
+import traceback
+import typing
+
+from extractor import scanner, utils
+
+CHECKPOINT_FILE = "checkpoint.json"
+QUARANTINE_FILE = "quarantine.jsonl"
+
+# save a checkpoint every so many finished files, a killed run parses at most this many files again
+CHECKPOINT_EVERY = 1000
+
+
+class FileError(typing.NamedTuple):
+    error: str
+    message: str
+    traceback: str
+
+
+def file_error(e: BaseException) -> FileError:
+    """
+    Returns the report entry of an exception caught earlier, e.g. collected by a scan
+    """
+    return FileError(type(e).__name__, str(e), "".join(traceback.format_exception(e)))
+
+
+class Checkpoint(typing.NamedTuple):
+    """
+    Number of finished files (a prefix of the scan order) and how far every output had been written at that point
+    """
+
+    files: int
+    fingerprint: str
+    offsets: dict[str, int]
+    quarantine: int
+
+
+class Quarantine:
+    """
+    Appends one JSON line per file that could not be parsed, with the exception and its traceback
+    """
+
+    def __init__(self, quarantine_file: pathlib.Path, offset: int | None = None):
+        self.failed = 0
+
+        if offset is None:
+            self.file = open(quarantine_file, "w")
+        else:
+            self.file = open(quarantine_file, "r+")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def __enter__(self) -> "Quarantine":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.file.close()
+
+    def add(self, file_path: pathlib.Path, file_error: FileError) -> None:
+        self.failed += 1
+        self.file.write(json.dumps({"path": str(file_path), **file_error._asdict()}) + "\n")
+        self.file.flush()
+
+    def offset(self) -> int:
+        return self.file.tell()
+
+
+class Checkpointer:
+    """
+    Saves a checkpoint every CHECKPOINT_EVERY finished files, after the outputs have been flushed
+    """
+
+    def __init__(
+        self,
+        checkpoint_file: pathlib.Path,
+        quarantine: Quarantine,
+        resume_from: Checkpoint | None = None,
+        every: int = CHECKPOINT_EVERY,
+    ):
+        self.checkpoint_file = checkpoint_file
+        self.quarantine = quarantine
+        self.every = every
+
+        self.files = resume_from.files if resume_from is not None else 0
+        self.fingerprint = resume_from.fingerprint if resume_from is not None else ""
+
+    def file_done(self, xml_file: scanner.ScannedFile, sinks: dict[str, typing.Any]) -> None:
+        self.files += 1
+        self.fingerprint = _chain(self.fingerprint, xml_file.path)
+
+        if self.files % self.every == 0:
+            self.save(sinks)
+
+    def save(self, sinks: dict[str, typing.Any]) -> None:
+        offsets = {table_name: sink.offset() for table_name, sink in sinks.items()}
+        save(self.checkpoint_file, Checkpoint(self.files, self.fingerprint, offsets, self.quarantine.offset()))
+
+    def finish(self) -> None:
+        # a finished run has nothing to resume
+        self.checkpoint_file.unlink(missing_ok=True)
+
+
+def load(checkpoint_file: pathlib.Path, xml_files: list[scanner.ScannedFile], table_names: typing.Iterable[str]) -> Checkpoint | None:
+    """
+    Returns the saved checkpoint, None when there is none.
+    Raises ValueError when the finished files of the checkpoint are not the first files of xml_files any more
+    or the checkpoint was saved for other output tables.
+    """
+    if not checkpoint_file.exists():
+        return None
+
+    checkpoint = Checkpoint(**json.loads(checkpoint_file.read_text()))
+
+    fingerprint = ""
+    for xml_file in xml_files[: checkpoint.files]:
+        fingerprint = _chain(fingerprint, xml_file.path)
+
+    if checkpoint.files > len(xml_files) or fingerprint != checkpoint.fingerprint or set(checkpoint.offsets) != set(table_names):
+        raise ValueError(f"{checkpoint_file} does not match the scanned files or the output tables, remove it to start from scratch")
+
+    return checkpoint
+
+
+def save(checkpoint_file: pathlib.Path, checkpoint: Checkpoint) -> None:
+    with utils.replace_file(checkpoint_file) as f:
+        f.write(json.dumps(checkpoint._asdict()))
+
+
+def _chain(fingerprint: str, file_path: pathlib.Path) -> str:
+    # hash of the previous fingerprint and the path, so the fingerprint of the finished files can be extended on resume
+    return hashlib.blake2b(f"{fingerprint}\n{file_path}".encode(), digest_size=16).hexdigest()
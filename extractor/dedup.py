@@ -0,0 +1,92 @@
+import datetime
+import json
+import math
+import pathlib
+import typing
+
+from extractor import catalog
+
+DUPLICATES_FILE = "duplicates.jsonl"
+
+# why a filing was dropped
+IDENTICAL = "identical"
+SUPERSEDED = "superseded"
+
+
+class Duplicate(typing.NamedTuple):
+    filing: catalog.Filing
+    kept: catalog.Filing
+    reason: str
+
+
+def resolve(filings: list[catalog.Filing]) -> tuple[list[catalog.Filing], list[Duplicate]]:
+    """
+    Drops the exact copies (same content hash) and then keeps a single return per EIN, tax period and form:
+    the one filed last, an amended return wins over the original when the timestamps tie or are missing,
+    then the one scanned last. Returns the kept filings in scan order and the dropped ones.
+    """
+    duplicates = []
+
+    originals: dict[str, catalog.Filing] = {}
+    unique = []
+    for filing in filings:
+        if filing.hash is not None:
+            original = originals.setdefault(filing.hash, filing)
+            if original is not filing:
+                duplicates.append(Duplicate(filing, original, IDENTICAL))
+                continue
+
+        unique.append(filing)
+
+    # index of the winning return of every key, only the header values are needed
+    latest: dict[tuple, tuple[tuple, catalog.Filing]] = {}
+    for position, filing in enumerate(unique):
+        key = return_key(filing)
+        if key is None:
+            continue
+
+        rank = (_timestamp(filing.timestamp), filing.amended, position)
+        if key not in latest or rank > latest[key][0]:
+            latest[key] = (rank, filing)
+
+    kept = []
+    for filing in unique:
+        key = return_key(filing)
+        winner = latest[key][1] if key is not None else filing
+
+        if winner is filing:
+            kept.append(filing)
+        else:
+            duplicates.append(Duplicate(filing, winner, SUPERSEDED))
+
+    return kept, duplicates
+
+
+def return_key(filing: catalog.Filing) -> tuple[str, str, str] | None:
+    """
+    EIN, tax period and form of the return, None when the header is incomplete and the filing can not be matched
+    """
+    tax_period = filing.tax_period_end or filing.tax_period_begin
+    if filing.ein is None or tax_period is None or filing.return_type is None:
+        return None
+
+    return filing.ein, tax_period, filing.return_type
+
+
+def write_report(report_file: pathlib.Path, duplicates: list[Duplicate]) -> None:
+    with open(report_file, "w") as f:
+        for duplicate in duplicates:
+            f.write(json.dumps({"path": str(duplicate.filing.path), "kept": str(duplicate.kept.path), "reason": duplicate.reason}) + "\n")
+
+
+def _timestamp(text: str | None) -> float:
+    # ReturnTs carries its UTC offset, a missing or broken one sorts before every other
+    try:
+        timestamp = datetime.datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return -math.inf
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+
+    return timestamp.timestamp()
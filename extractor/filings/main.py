@@ -0,0 +1,18 @@
+from xml.dom.minidom import Document
+
+from extractor import utils
+from . import parser
+
+FILING_ID = parser.FILING_ID
+COLUMNS = parser.COLUMNS
+# Parquet and Arrow outputs get one directory per filing year and form type
+PARTITION_COLUMNS = [parser.FILING_YEAR, parser.FORM_TYPE]
+# a re-run replaces the rows stored in a database under the same filing
+KEY_COLUMNS = [parser.CHARITY_EIN, parser.FILING_YEAR, parser.FORM_TYPE]
+
+# one row per filing, nothing to extract from repeated groups
+RECORD_EXTRACTORS: dict[str, utils.RecordExtractor] = {}
+
+
+def extract(doc_type: str, document: Document, records: utils.Records | None = None) -> list[dict]:
+    return [parser.extract_filing_data(document)]
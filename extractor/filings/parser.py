@@ -0,0 +1,40 @@
+from xml.dom.minidom import Document
+
+from extractor import plans
+
+FILING_ID = "Filing ID"
+FILING_YEAR = "Filing Year"
+CHARITY_EIN = "EIN"
+BUSINESS_NAME = "Name of organization"
+CITY_OR_TOWN = "City/Town"
+STATE_OR_PROVINCE = "State/Province"
+ZIPCODE = "Zip Code"
+FORM_TYPE = "Type"
+COUNTRY = "Country"
+ADDRESS1 = "Address 1"  # changed from Number and Street (some provided only a PO Box)
+
+# filer columns the staff and beneficiaries rows are joined with, in the order they are written
+COLUMNS = [FILING_YEAR, FORM_TYPE, CHARITY_EIN, BUSINESS_NAME, CITY_OR_TOWN, ZIPCODE, STATE_OR_PROVINCE, ADDRESS1, COUNTRY]
+
+# fields every form type has, read from the return header
+FIELDS = [
+    plans.Field(FILING_YEAR, f"{plans.HEADER_PATH}/TaxPeriodBeginDt", convert=plans.filing_year),
+    plans.Field(FORM_TYPE, f"{plans.HEADER_PATH}/ReturnTypeCd"),
+    plans.Field(CHARITY_EIN, f"{plans.FILER_PATH}/EIN"),
+    plans.Field(BUSINESS_NAME, f"{plans.FILER_PATH}/BusinessName/BusinessNameLine1Txt"),
+    plans.Field(CITY_OR_TOWN, f"{plans.FILER_ADDRESS_PATH}/CityNm"),
+    plans.Field(ZIPCODE, f"{plans.FILER_ADDRESS_PATH}/ZIPCd"),
+    plans.Field(STATE_OR_PROVINCE, f"{plans.FILER_ADDRESS_PATH}/StateAbbreviationCd"),
+    plans.Field(ADDRESS1, f"{plans.FILER_ADDRESS_PATH}/AddressLine1Txt"),
+]
+
+PLAN = plans.compile_plan(FIELDS)
+
+
+def extract_filing_data(dom: Document) -> dict[str, str]:
+    data = plans.run_plan(PLAN, dom)
+
+    # set the filer address to US
+    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found
+
+    return data
@@ -0,0 +1,194 @@
+import bisect
+import csv
+import http.server
+import json
+import mmap
+import os
+import pathlib
+import struct
+import typing
+import urllib.parse
+
+from extractor import utils
+
+# tables are looked up by EIN, the normalized staff and grants tables by the Filing ID of the EIN's filings
+EIN = "EIN"
+FILING_ID = "Filing ID"
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"EXTIDX01"
+
+# magic, size and mtime_ns of the indexed csv file, number of entries
+HEADER = struct.Struct("<8sQQQ")
+# key (NUL padded), offset and length of the row in the csv file
+ENTRY = struct.Struct("<16sQI")
+KEY_SIZE = 16
+
+DEFAULT_PORT = 8990
+
+
+class TableIndex:
+    """
+    Sorted key -> row offset index of a csv table, the index and the table are both memory-mapped
+    so a lookup is a binary search over the index and a slice of the table
+    """
+
+    def __init__(self, data_file: pathlib.Path, key_column: str):
+        self.data_file = data_file
+        self.key_column = key_column
+
+        index_file = data_file.with_name(f"{data_file.name}{INDEX_SUFFIX}")
+        stat = os.stat(data_file)
+        if not _is_current(index_file, stat):
+            build_index(data_file, index_file, key_column)
+
+        with open(index_file, "rb") as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        with open(data_file, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.header = next(csv.reader([self.data[: self.data.find(b"\n")].decode()]))
+        self.keys = _Keys(self.index)
+
+    def lookup(self, key: str) -> list[dict[str, str]]:
+        packed_key = _pack_key(key)
+
+        rows = []
+        position = bisect.bisect_left(self.keys, packed_key)
+        while position < len(self.keys) and self.keys[position] == packed_key:
+            _, offset, length = ENTRY.unpack_from(self.index, HEADER.size + position * ENTRY.size)
+            row = next(csv.reader([self.data[offset : offset + length].decode()]))
+            rows.append(dict(zip(self.header, row)))
+            position += 1
+
+        return rows
+
+    def close(self) -> None:
+        self.index.close()
+        self.data.close()
+
+
+class _Keys(typing.Sequence[bytes]):
+    # the keys of the index entries as a sequence bisect can search without reading the whole index
+    def __init__(self, index: mmap.mmap):
+        self.index = index
+        self.count = HEADER.unpack_from(index)[3]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = HEADER.size + position * ENTRY.size
+        return self.index[start : start + KEY_SIZE]
+
+
+def build_index(data_file: pathlib.Path, index_file: pathlib.Path, key_column: str) -> None:
+    """
+    Writes the index of a csv table written by the extractor, rows can span several lines when a value holds a newline
+    """
+    stat = os.stat(data_file)
+    entries = []
+
+    with open(data_file, "rb") as f:
+        header = next(csv.reader([f.readline().decode()]))
+        key_position = header.index(key_column)
+
+        while True:
+            offset = f.tell()
+            record = f.readline()
+            if not record:
+                break
+
+            # quotes are doubled inside quoted values, an odd count means the row goes on
+            while record.count(b'"') % 2 and (line := f.readline()):
+                record += line
+
+            row = next(csv.reader([record.decode()]))
+            entries.append((_pack_key(row[key_position]), offset, len(record)))
+
+    entries.sort()
+
+    # a server starting meanwhile never maps a truncated index
+    with utils.replace_file(index_file, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+
+
+def _is_current(index_file: pathlib.Path, stat: os.stat_result) -> bool:
+    try:
+        with open(index_file, "rb") as f:
+            magic, size, mtime_ns, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+
+    return magic == INDEX_MAGIC and (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+
+
+def _pack_key(key: str) -> bytes:
+    return key.strip().encode()[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+
+
+class Lookup:
+    """
+    Every csv table of the output directory with an EIN (or Filing ID) column, indexed on that column
+    """
+
+    def __init__(self, output_path: pathlib.Path):
+        self.by_ein: dict[str, TableIndex] = {}
+        self.by_filing_id: dict[str, TableIndex] = {}
+
+        for data_file in sorted(output_path.glob("*.csv")):
+            with open(data_file, newline="") as f:
+                header = next(csv.reader(f), [])
+
+            if EIN in header:
+                self.by_ein[data_file.stem] = TableIndex(data_file, EIN)
+            elif FILING_ID in header:
+                self.by_filing_id[data_file.stem] = TableIndex(data_file, FILING_ID)
+
+    def find(self, ein: str) -> dict[str, list[dict[str, str]]]:
+        tables = {table_name: table.lookup(ein) for table_name, table in self.by_ein.items()}
+
+        filing_ids = {row[FILING_ID] for rows in tables.values() for row in rows if FILING_ID in row}
+        for table_name, table in self.by_filing_id.items():
+            tables[table_name] = [row for filing_id in sorted(filing_ids) for row in table.lookup(filing_id)]
+
+        return tables
+
+    def close(self) -> None:
+        for table in [*self.by_ein.values(), *self.by_filing_id.values()]:
+            table.close()
+
+
+def serve(output_path: pathlib.Path, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+    """
+    Answers GET /ein/<EIN> with the rows of every table as JSON until interrupted
+    """
+    lookup = Lookup(output_path)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            prefix, _, ein = urllib.parse.urlsplit(self.path).path.strip("/").partition("/")
+            if prefix != "ein" or not ein:
+                self.send_error(404, "Use /ein/<EIN>")
+                return
+
+            body = json.dumps({"ein": ein, "tables": lookup.find(ein)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            # thousands of lookups per minute would flood the terminal
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        lookup.close()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import pathlib
+import sqlite3
+import typing
+
+from extractor import scanner
+
+MANIFEST_FILE = "manifest.sqlite"
+
+# bumped when the stored rows change shape, a manifest of another version is emptied and every file is parsed again
+MANIFEST_VERSION = 2
+
+# commit the stored rows every so many files, a killed run loses at most this many parsed files
+COMMIT_EVERY = 1000
+
+
+class Manifest:
+    """
+    Remembers the size, mtime (and optionally the content hash) of every parsed file together with its extracted rows,
+    so a re-run only needs to parse new or changed files
+    """
+
+    def __init__(self, manifest_file: pathlib.Path, base_path: pathlib.Path, use_hash: bool = False):
+        self.base_path = base_path
+        self.use_hash = use_hash
+        self.uncommitted = 0
+
+        self.connection = sqlite3.connect(manifest_file)
+
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != MANIFEST_VERSION:
+            self.connection.executescript(
+                f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS rows;
+                PRAGMA user_version = {MANIFEST_VERSION};
+                """
+            )
+
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rows (
+                path TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (path, table_name)
+            );
+            """
+        )
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def key(self, file_path: pathlib.Path) -> str:
+        return pathlib.Path(file_path).relative_to(self.base_path).as_posix()
+
+    def changed_files(self, xml_files: list[scanner.ScannedFile]) -> list[scanner.ScannedFile]:
+        """
+        Returns the files that are new or differ from the manifest, in the order of xml_files
+        """
+        known = {
+            path: (size, mtime_ns, file_hash)
+            for path, size, mtime_ns, file_hash in self.connection.execute("SELECT path, size, mtime_ns, hash FROM files")
+        }
+
+        changed = []
+        for xml_file in xml_files:
+            key = self.key(xml_file.path)
+            size, mtime_ns = xml_file.size, xml_file.mtime_ns
+
+            if key not in known:
+                changed.append(xml_file)
+                continue
+
+            known_size, known_mtime_ns, file_hash = known[key]
+            if (known_size, known_mtime_ns) == (size, mtime_ns):
+                continue
+
+            # touched but identical files (e.g. copied again by a sync job) keep their rows
+            if self.use_hash and file_hash is not None and file_hash == hash_file(xml_file.path):
+                self.connection.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, key))
+                continue
+
+            changed.append(xml_file)
+
+        return changed
+
+    def store(self, xml_file: scanner.ScannedFile, rows: dict[str, list[dict]]) -> None:
+        key = self.key(xml_file.path)
+        file_hash = hash_file(xml_file.path) if self.use_hash else None
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+            (key, xml_file.size, xml_file.mtime_ns, file_hash),
+        )
+        self.connection.execute("DELETE FROM rows WHERE path = ?", (key,))
+        self.connection.executemany(
+            "INSERT INTO rows (path, table_name, data) VALUES (?, ?, ?)",
+            [(key, table_name, json.dumps(table_rows)) for table_name, table_rows in rows.items()],
+        )
+
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def remove_missing(self, xml_files: list[scanner.ScannedFile]) -> None:
+        """
+        Drops the files (and their rows) which are no longer in the data directory
+        """
+        present = {self.key(xml_file.path) for xml_file in xml_files}
+        missing = [(path,) for (path,) in self.connection.execute("SELECT path FROM files") if path not in present]
+
+        self.connection.executemany("DELETE FROM rows WHERE path = ?", missing)
+        self.connection.executemany("DELETE FROM files WHERE path = ?", missing)
+        self.connection.commit()
+
+    def load(self, file_path: pathlib.Path) -> dict[str, list[dict]]:
+        cursor = self.connection.execute("SELECT table_name, data FROM rows WHERE path = ?", (self.key(file_path),))
+        return {table_name: json.loads(data) for table_name, data in cursor}
+
+
+def hash_file(file_path: pathlib.Path) -> str:
+    with scanner.open_file(file_path) as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()
+
+
+def cached_extract(
+    manifest: Manifest,
+    xml_files: list[scanner.ScannedFile],
+    extracted: typing.Iterable[tuple[scanner.ScannedFile, dict[str, list[dict]] | None]],
+    scanned_files: list[scanner.ScannedFile] | None = None,
+) -> typing.Generator[tuple[scanner.ScannedFile, dict[str, list[dict]]], None, None]:
+    """
+    Stores the freshly extracted rows and then yields the rows of every file in xml_files from the manifest.
+    Only files missing from scanned_files (all of the data directory, defaults to xml_files) are dropped.
+    Files that failed (None rows) are not stored, so they are parsed again on the next run.
+    """
+    for xml_file, rows in extracted:
+        if rows is not None:
+            manifest.store(xml_file, rows)
+
+    manifest.remove_missing(scanned_files if scanned_files is not None else xml_files)
+
+    for xml_file in xml_files:
+        yield xml_file, manifest.load(xml_file.path)
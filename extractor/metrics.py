@@ -0,0 +1,119 @@
+import heapq
+import json
+import pathlib
+import sys
+import time
+
+# parsing stages, read/parse/extract are measured inside the workers and add up over all of them
+STAGES = ["scan", "read", "parse", "extract", "write"]
+
+# number of slowest files kept for the summary
+SLOWEST_FILES = 10
+
+METRICS_FILE = "metrics.json"
+
+
+class Metrics:
+    """
+    Counts files, bytes and rows per table and the time spent in every stage,
+    shows a throttled progress line on stderr and dumps a JSON summary at the end of the run
+    """
+
+    def __init__(self, progress_interval: float | None = None):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.failed = 0
+        self.skipped: dict[str, int] = {}
+        self.bytes = 0
+        self.rows: dict[str, int] = {}
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.slowest: list[tuple[float, str, int]] = []
+
+        self.total_files = 0
+        self.total_bytes = 0
+
+        # redraw in place on a terminal, otherwise keep the log small
+        self.interactive = sys.stderr.isatty()
+        self.progress_interval = progress_interval or (0.5 if self.interactive else 30.0)
+        self.last_progress = 0.0
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] += seconds
+
+    def expect(self, files: int, size: int) -> None:
+        """
+        Sets the number of files (and their bytes) the run is going to parse, used for the ETA
+        """
+        self.total_files = files
+        self.total_bytes = size
+
+    def file_done(self, file_path: pathlib.Path, size: int, timings: dict[str, float], failed: bool = False) -> None:
+        self.files += 1
+        self.failed += failed
+        self.bytes += size
+
+        for stage, seconds in timings.items():
+            self.seconds[stage] += seconds
+
+        entry = (sum(timings.values()), str(file_path), size)
+        if len(self.slowest) < SLOWEST_FILES:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+        self.progress()
+
+    def files_skipped(self, reason: str, files: int) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + files
+
+    def rows_written(self, table_name: str, rows: int) -> None:
+        self.rows[table_name] = self.rows.get(table_name, 0) + rows
+
+    def progress(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self.last_progress < self.progress_interval:
+            return
+
+        self.last_progress = now
+        elapsed = now - self.started
+        rate = self.files / elapsed if elapsed else 0.0
+
+        line = f"{self.files}/{self.total_files} files {self.bytes / 2**20:.1f} MB {rate:.1f} files/s"
+        if self.failed:
+            line += f" {self.failed} failed"
+        if rate and self.total_files > self.files:
+            line += f" ETA {_format_seconds((self.total_files - self.files) / rate)}"
+
+        sys.stderr.write(f"\r{line}\033[K" if self.interactive else f"{line}\n")
+        sys.stderr.flush()
+
+    def summary(self) -> dict:
+        wall_seconds = time.perf_counter() - self.started
+
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "wall_seconds": wall_seconds,
+            "files_per_s": self.files / wall_seconds if wall_seconds else 0.0,
+            "mb_per_s": self.bytes / 2**20 / wall_seconds if wall_seconds else 0.0,
+            "stage_seconds": self.seconds,
+            "slowest_files": [
+                {"path": path, "seconds": seconds, "bytes": size} for seconds, path, size in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def dump(self, metrics_file: pathlib.Path) -> None:
+        self.progress(force=True)
+        if self.interactive:
+            sys.stderr.write("\n")
+
+        metrics_file.write_text(json.dumps(self.summary(), indent=2))
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
@@ -1,30 +1,26 @@
-import pathlib
+from xml.dom.minidom import Document
 
-from extractor import scanner, printer, utils
+from extractor import utils
 from . import parser
 
+COLUMNS = parser.COLUMNS
+# Parquet and Arrow outputs get one directory per filing year and form type
+PARTITION_COLUMNS = [parser.FILING_YEAR, parser.FORM_TYPE]
+# a re-run replaces the rows stored in a database under the same filing
+KEY_COLUMNS = [parser.CHARITY_EIN, parser.FILING_YEAR, parser.FORM_TYPE]
 
-def parse(base_path: pathlib.Path, output_file: pathlib.Path) -> None:
-    xml_files = scanner.scan_xml_files(base_path)
+# one row per filing, nothing to extract from repeated groups
+RECORD_EXTRACTORS: dict[str, utils.RecordExtractor] = {}
 
-    organized_xmls = utils.organize_xmls(xml_files=xml_files)
 
-    # target_columns = [parser.BUSINESS_NAME, parser.EIN, parser.FILING_YEAR, parser.CITY_OR_TOWN, parser.STATE_OR_PROVINCE]
+def extract(doc_type: str, document: Document, records: utils.Records | None = None) -> list[dict]:
+    if doc_type == "990":
+        one_line = parser.extract_data_990(document)
+    elif doc_type == "990EZ":
+        one_line = parser.extract_data_990EZ(document)
+    elif doc_type == "990PF":
+        one_line = parser.extract_data_990PF(document)
+    else:
+        raise Exception(f"Unknown type {doc_type}")
 
-    all_data: list[dict] = []
-
-    for ein, doc_type, file_name, document in organized_xmls:
-        print(f"Processing file {file_name}...")
-
-        if doc_type == "990":
-            one_line = parser.extract_data_990(document)
-        elif doc_type == "990EZ":
-            one_line = parser.extract_data_990EZ(document)
-        elif doc_type == "990PF":
-            one_line = parser.extract_data_990PF(document)
-        else:
-            raise Exception(f"Unknown type {doc_type}")
-
-        all_data.append(one_line)
-
-    printer.to_csv(data=all_data, target_file=output_file)
+    return [one_line]
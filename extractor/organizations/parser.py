@@ -4,12 +4,9 @@
 # Extract the files to create several CSV files
 #
 
-from datetime import datetime, date
-import pathlib
-import typing
-from xml.dom.minidom import parse, Document
+from xml.dom.minidom import Document
 
-from extractor import utils
+from extractor import plans
 
 # set the names for the constants which are used to hold extracted data xmls and properly arrange them
 FILING_YEAR = "Filing Year"
@@ -37,140 +34,92 @@ CONTRACTORS_OVER_100K = "total number of independent contractors receiving over
 UNRELATED_BUSINESS_REVENUE = "Total unrelated business revenue" # 990 specific
 DONOR_ADVISED_FUND = "did the organization maintain any donor advised fund" # 990 specific
 LOCAL_CHAPTERS = "B10a: did the organziation have local chapters or affiliates" # 990 specific
- 
-def extract_common_data(dom: Document) -> dict[str, str]:
-    data = {}
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    header_element = utils.extract_single_tag(return_element, "ReturnHeader")
 
+# output columns in the order they are written, rows of every form type share this header
+COLUMNS = [
+    FILING_YEAR, FORM_TYPE, CHARITY_EIN, PHONE, BUSINESS_NAME, CITY_OR_TOWN, ZIPCODE, STATE_OR_PROVINCE, COUNTRY, ADDRESS1, ADDRESS2,
+    OFFICER_NAME, OFFICER_TITLE,
+    MISSION, EXPENSES, REVENUE, EMPLOYEES, VOLUNTEERS, CONTRACTORS_OVER_100K, UNRELATED_BUSINESS_REVENUE, DONOR_ADVISED_FUND, LOCAL_CHAPTERS,
+    TRANSFER_TO_EXEMPT,
+    FMV_ASSETS, EMPLOYEES_OVER_50K,
+]
+ 
+# fields every form type has, read from the return header
+COMMON_FIELDS = [
     # Get the filing year
-    tax_period_begin_text = utils.extract_single_tag_value(header_element, "TaxPeriodBeginDt")
-    tax_period_begin: date = datetime.strptime(tax_period_begin_text, "%Y-%m-%d")
-    data[FILING_YEAR] = tax_period_begin.year
-
+    plans.Field(FILING_YEAR, f"{plans.HEADER_PATH}/TaxPeriodBeginDt", convert=plans.filing_year),
     # get file type
-    form_type = utils.extract_single_tag_value(header_element, "ReturnTypeCd")
-    data[FORM_TYPE] = form_type
-
-    filer_element = utils.extract_single_tag(header_element, "Filer")
-
+    plans.Field(FORM_TYPE, f"{plans.HEADER_PATH}/ReturnTypeCd"),
     # Get filer EIN
-    charity_ein = utils.extract_single_tag_value(filer_element, "EIN")
-    phonenumber = utils.extract_single_tag_value(filer_element, "PhoneNum", optional=True)
-    data[CHARITY_EIN] = charity_ein
-    data[PHONE] = phonenumber
-
+    plans.Field(CHARITY_EIN, f"{plans.FILER_PATH}/EIN"),
+    plans.Field(PHONE, f"{plans.FILER_PATH}/PhoneNum", optional=True),
     # Get filer business name
-    business_name_element = utils.extract_single_tag(filer_element, "BusinessName")
-    business_name = utils.extract_single_tag_value(business_name_element, "BusinessNameLine1Txt")
-    data[BUSINESS_NAME] = business_name
-
-    # find address section and step into it
-    us_address_element = utils.extract_single_tag(filer_element, "USAddress")
-
-    # find the filer city/town
-    city_or_town = utils.extract_single_tag_value(us_address_element, "CityNm")
-    # find the filer zipcode
-    zipcode = utils.extract_single_tag_value(us_address_element, "ZIPCd")
-    # find the filer state/province
-    state_or_province = utils.extract_single_tag_value(us_address_element, "StateAbbreviationCd")
-    address1 = utils.extract_single_tag_value(us_address_element, "AddressLine1Txt")
+    plans.Field(BUSINESS_NAME, f"{plans.FILER_PATH}/BusinessName/BusinessNameLine1Txt"),
+    # filer address
+    plans.Field(CITY_OR_TOWN, f"{plans.FILER_ADDRESS_PATH}/CityNm"),
+    plans.Field(ZIPCODE, f"{plans.FILER_ADDRESS_PATH}/ZIPCd"),
+    plans.Field(STATE_OR_PROVINCE, f"{plans.FILER_ADDRESS_PATH}/StateAbbreviationCd"),
+    plans.Field(ADDRESS1, f"{plans.FILER_ADDRESS_PATH}/AddressLine1Txt"),
     # address2 was made optional because while some forms put in two lines of details for the address, some only had PO boxes or generally left this empty
-    address2 = utils.extract_single_tag_value(us_address_element, "AddressLine2Txt", optional=True)
-
-    data[CITY_OR_TOWN] = city_or_town
-    data[ZIPCODE] = zipcode
-    data[STATE_OR_PROVINCE] = state_or_province
-    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found 
-    data[ADDRESS1] = address1
-    data[ADDRESS2] = address2
-
+    plans.Field(ADDRESS2, f"{plans.FILER_ADDRESS_PATH}/AddressLine2Txt", optional=True),
     # get signing officer name and title
-    business_group_element = utils.extract_single_tag(header_element, "BusinessOfficerGrp")
-
-    signing_officer_name = utils.extract_single_tag_value(business_group_element, "PersonNm")         
-    signing_officer_title = utils.extract_single_tag_value(business_group_element, "PersonTitleTxt")
-
-    data[OFFICER_NAME] = signing_officer_name
-    data[OFFICER_TITLE] = signing_officer_title
-
-    return data
-
-
-def extract_data_990(dom: Document) -> dict[str, str]:
-    data = extract_common_data(dom)
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    data_element = utils.extract_single_tag(return_element, "ReturnData")
-    irs990_element = utils.extract_single_tag(data_element, "IRS990")
+    plans.Field(OFFICER_NAME, f"{plans.HEADER_PATH}/BusinessOfficerGrp/PersonNm"),
+    plans.Field(OFFICER_TITLE, f"{plans.HEADER_PATH}/BusinessOfficerGrp/PersonTitleTxt"),
+]
 
+IRS990_PATH = f"{plans.RETURN_DATA_PATH}/IRS990"
+FIELDS_990 = [
     # TODO extract 990 only fields
-    mission = utils.extract_single_tag_value(irs990_element, "ActivityOrMissionDesc")
-    expense = utils.extract_single_tag_value(irs990_element, "ExpenseAmt", optional=True)
-    revenue = utils.extract_single_tag_value(irs990_element, "RevenueAmt", optional=True)
-    num_volunteers = utils.extract_single_tag_value(irs990_element, "TotalVolunteersCnt", optional=True)
-    num_employees = utils.extract_single_tag_value(irs990_element, "TotalEmployeeCnt", optional=True)
-    contractors_receiving_over_100k = utils.extract_single_tag_value(irs990_element, "IndivRcvdGreaterThan100KCnt")
-    unrelated_business_revenue = utils.extract_single_tag_value(irs990_element, "UnrelatedBusinessRevenueAmt", optional=True)
-    donor_advised_fund = utils.extract_single_tag_value(irs990_element, "DonorAdvisedFundInd")
-    local_chapters = utils.extract_single_tag_value(irs990_element, "LocalChaptersInd")
-
-
-    data[MISSION] = mission
-    data[EXPENSES] = expense
-    data[REVENUE] = revenue
-    data[EMPLOYEES] = num_employees
-    data[VOLUNTEERS] = num_volunteers
-    data[CONTRACTORS_OVER_100K] = contractors_receiving_over_100k
-    data[UNRELATED_BUSINESS_REVENUE] = unrelated_business_revenue
-    data[DONOR_ADVISED_FUND] = donor_advised_fund
-    data[LOCAL_CHAPTERS] = local_chapters
-
-    # field = some value
-    # result[field name] = value
-
-    return data
-
-
-def extract_data_990EZ(dom: Document) -> dict[str, str]:
-    data = extract_common_data(dom)
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    data_element = utils.extract_single_tag(return_element, "ReturnData")
-    irs990EZ_element = utils.extract_single_tag(data_element, "IRS990EZ")
-
+    plans.Field(MISSION, f"{IRS990_PATH}/ActivityOrMissionDesc"),
+    plans.Field(EXPENSES, f"{IRS990_PATH}/ExpenseAmt", optional=True),
+    plans.Field(REVENUE, f"{IRS990_PATH}/RevenueAmt", optional=True),
+    plans.Field(EMPLOYEES, f"{IRS990_PATH}/TotalEmployeeCnt", optional=True),
+    plans.Field(VOLUNTEERS, f"{IRS990_PATH}/TotalVolunteersCnt", optional=True),
+    plans.Field(CONTRACTORS_OVER_100K, f"{IRS990_PATH}/IndivRcvdGreaterThan100KCnt"),
+    plans.Field(UNRELATED_BUSINESS_REVENUE, f"{IRS990_PATH}/UnrelatedBusinessRevenueAmt", optional=True),
+    plans.Field(DONOR_ADVISED_FUND, f"{IRS990_PATH}/DonorAdvisedFundInd"),
+    plans.Field(LOCAL_CHAPTERS, f"{IRS990_PATH}/LocalChaptersInd"),
+]
+
+IRS990EZ_PATH = f"{plans.RETURN_DATA_PATH}/IRS990EZ"
+FIELDS_990EZ = [
     # TODO extract EZ only fields
 
     # 49a: did the org make any transfers to an exempt non charitable related org
         # most are mpty, some come out as "FALSE" and some as the numeral 0
             # TODO: figure out a consistent format for it
-    transfer_to_exempt_element = utils.extract_single_tag_value(irs990EZ_element, "TrnsfrExmptNonChrtblRltdOrgInd", optional=True)
+    plans.Field(TRANSFER_TO_EXEMPT, f"{IRS990EZ_PATH}/TrnsfrExmptNonChrtblRltdOrgInd", optional=True),
     # 51d: total number of independent contractors receiving over $100K
+]
 
-    data[TRANSFER_TO_EXEMPT] = transfer_to_exempt_element
-
-    return data
+IRS990PF_PATH = f"{plans.RETURN_DATA_PATH}/IRS990PF"
+FIELDS_990PF = [
+    # TODO extract PF only fields
+    plans.Field(FMV_ASSETS, f"{IRS990PF_PATH}/FMVAssetsEOYAmt", optional=True),
+    plans.Field(EMPLOYEES_OVER_50K, f"{IRS990PF_PATH}/OfficerDirTrstKeyEmplInfoGrp/OtherEmployeePaidOver50kCnt", optional=True),
+    # the only form with a beneficiaries section TBD
+]
 
+# compiled once per form type, a single walk of the document fills the whole row
+PLAN_990 = plans.compile_plan([*COMMON_FIELDS, *FIELDS_990])
+PLAN_990EZ = plans.compile_plan([*COMMON_FIELDS, *FIELDS_990EZ])
+PLAN_990PF = plans.compile_plan([*COMMON_FIELDS, *FIELDS_990PF])
 
-def extract_data_990PF(dom: Document) -> dict[str, str]:     
-    data = extract_common_data(dom)
 
-    return_element = utils.extract_single_tag(dom, "Return")
-    data_element = utils.extract_single_tag(return_element, "ReturnData")
-    irs990PF_element = utils.extract_single_tag(data_element, "IRS990PF")
-    employee_info_group_element = utils.extract_single_tag(irs990PF_element, "OfficerDirTrstKeyEmplInfoGrp")
+def extract_data(plan: plans.Plan, dom: Document) -> dict[str, str]:
+    data = plans.run_plan(plan, dom)
+    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found
 
-    # TODO extract PF only fields 
-    fmv_assets_element = utils.extract_single_tag_value(irs990PF_element, "FMVAssetsEOYAmt", optional=True) 
-    other_employees_receiving_over_50k_element = utils.extract_single_tag_value(employee_info_group_element, "OtherEmployeePaidOver50kCnt", optional=True)
+    return data
 
-    data[FMV_ASSETS] = fmv_assets_element 
-    data[EMPLOYEES_OVER_50K] = other_employees_receiving_over_50k_element
 
-    # the only form with a beneficiaries section TBD
+def extract_data_990(dom: Document) -> dict[str, str]:
+    return extract_data(PLAN_990, dom)
 
-    return data
 
+def extract_data_990EZ(dom: Document) -> dict[str, str]:
+    return extract_data(PLAN_990EZ, dom)
 
 
+def extract_data_990PF(dom: Document) -> dict[str, str]:
+    return extract_data(PLAN_990PF, dom)
@@ -0,0 +1,569 @@
+import concurrent.futures
+import hashlib
+import mmap
+import pathlib
+import time
+import traceback
+import types
+import typing
+
+from extractor import catalog, checkpoint, dedup, manifest, metrics, scanner, shards, printer, streaming, utils
+from extractor.organizations import main as organizations
+from extractor.accountants import main as accountants
+from extractor.filings import main as filings
+from extractor.staff import main as staff
+from extractor.beneficiaries import main as beneficiaries
+
+# every table extractor receives the same parsed document, staff and beneficiaries only return their own columns
+TABLES: dict[str, types.ModuleType] = {
+    "organizations": organizations,
+    "accountants": accountants,
+    "filings": filings,
+    "staff": staff,
+    "beneficiaries": beneficiaries,
+}
+
+# how the filing is attached to the rows of an output: not at all, by joining in the filer columns or by the filing id
+LINK_NONE = "none"
+LINK_JOIN = "join"
+LINK_KEY = "key"
+
+
+class Output(typing.NamedTuple):
+    """
+    A written table, its rows come from one of the extracted tables
+    """
+
+    table_name: str
+    columns: list[str]
+    partition_columns: list[str]
+    key_columns: list[str]
+    link: str = LINK_NONE
+
+
+# the key of every output is also its file name.
+# denormalized copies the filer columns into every staff and beneficiaries row (the original layout),
+# normalized writes them once into filings and the other tables only point to it by the filing id.
+LAYOUTS: dict[str, dict[str, Output]] = {
+    "denormalized": {
+        "organizations": Output(
+            "organizations", organizations.COLUMNS, organizations.PARTITION_COLUMNS, organizations.KEY_COLUMNS
+        ),
+        "accountants": Output("accountants", accountants.COLUMNS, accountants.PARTITION_COLUMNS, accountants.KEY_COLUMNS),
+        "staff": Output("staff", staff.COLUMNS, staff.PARTITION_COLUMNS, staff.KEY_COLUMNS, LINK_JOIN),
+        "beneficiaries": Output(
+            "beneficiaries", beneficiaries.COLUMNS, beneficiaries.PARTITION_COLUMNS, beneficiaries.KEY_COLUMNS, LINK_JOIN
+        ),
+    },
+    "normalized": {
+        "filings": Output(
+            "filings", [filings.FILING_ID, *filings.COLUMNS], filings.PARTITION_COLUMNS, filings.KEY_COLUMNS, LINK_KEY
+        ),
+        "organizations": Output(
+            "organizations",
+            [filings.FILING_ID, *organizations.COLUMNS],
+            organizations.PARTITION_COLUMNS,
+            organizations.KEY_COLUMNS,
+            LINK_KEY,
+        ),
+        "accountants": Output(
+            "accountants",
+            [filings.FILING_ID, *accountants.COLUMNS],
+            accountants.PARTITION_COLUMNS,
+            accountants.KEY_COLUMNS,
+            LINK_KEY,
+        ),
+        # the child tables have no filing year or form type to partition on, only the filing id to replace them by
+        "staff": Output("staff", [filings.FILING_ID, *staff.CHILD_COLUMNS], [], [filings.FILING_ID], LINK_KEY),
+        "grants": Output("beneficiaries", [filings.FILING_ID, *beneficiaries.CHILD_COLUMNS], [], [filings.FILING_ID], LINK_KEY),
+    },
+}
+
+# repeated groups of all the tables, each tag belongs to a single table
+RECORD_EXTRACTORS: dict[str, utils.RecordExtractor] = {
+    tag_name: record_extractor for table in TABLES.values() for tag_name, record_extractor in table.RECORD_EXTRACTORS.items()
+}
+
+# repeated groups of only some of the tables, keyed by the table names in TABLES order
+_SELECTED_RECORD_EXTRACTORS: dict[tuple[str, ...], dict[str, utils.RecordExtractor]] = {}
+
+# minidom builds the whole document, iterparse extracts the repeated groups while reading and drops them
+ENGINES: dict[str, typing.Callable[[bytes, dict[str, utils.RecordExtractor]], tuple[typing.Any, utils.Records]]] = {
+    "minidom": utils.parse_xml_records,
+    "iterparse": streaming.parse_xml_records,
+}
+
+# number of files handed to the worker pool at once per worker
+FILES_PER_WORKER = 32
+
+# files loaded ahead of the parser, with workers the kernel is only asked to read them into the page cache
+READ_AHEAD = 8
+
+
+def extract_file(
+    file_path: pathlib.Path,
+    engine: str = "minidom",
+    prefetched: concurrent.futures.Future | None = None,
+    table_names: tuple[str, ...] | None = None,
+) -> tuple[dict[str, list[dict]], dict[str, float]]:
+    """
+    Parses one file and returns the extracted rows of every table together with the time spent in each stage.
+    With prefetched the contents come from the read-ahead, the read time is then only the wait for it.
+    With table_names only those tables are extracted, the repeated groups of the others are not even collected.
+    """
+    tables = TABLES if table_names is None else {table_name: TABLES[table_name] for table_name in table_names}
+
+    started = time.perf_counter()
+    data = prefetched.result() if prefetched is not None else scanner.load_file(file_path)
+    read = time.perf_counter()
+
+    try:
+        document, records = ENGINES[engine](data, record_extractors(table_names))
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    parsed = time.perf_counter()
+
+    doc_type = utils.extract_file_type(document)
+    # the staff and grant rows are generated from the records, they are drained once here so that a file failing
+    # half way fails as a whole and the rows can be sent back from the workers
+    rows = {table_name: list(table.extract(doc_type, document, records)) for table_name, table in tables.items()}
+    extracted = time.perf_counter()
+
+    return rows, {"read": read - started, "parse": parsed - read, "extract": extracted - parsed}
+
+
+def record_extractors(table_names: tuple[str, ...] | None = None) -> dict[str, utils.RecordExtractor]:
+    """
+    Returns the repeated groups of the tables, all of them without table_names
+    """
+    if table_names is None:
+        return RECORD_EXTRACTORS
+
+    selected = _SELECTED_RECORD_EXTRACTORS.get(table_names)
+    if selected is None:
+        selected = {
+            tag_name: record_extractor
+            for table_name in table_names
+            for tag_name, record_extractor in TABLES[table_name].RECORD_EXTRACTORS.items()
+        }
+        _SELECTED_RECORD_EXTRACTORS[table_names] = selected
+
+    return selected
+
+
+def required_tables(outputs: dict[str, Output]) -> tuple[str, ...]:
+    """
+    Returns the names of the tables the outputs are made of in TABLES order, joined outputs also need the filings table
+    """
+    needed = {output.table_name for output in outputs.values()}
+    if any(output.link == LINK_JOIN for output in outputs.values()):
+        needed.add("filings")
+
+    return tuple(table_name for table_name in TABLES if table_name in needed)
+
+
+def select_outputs(layout: str = "denormalized", tables: typing.Iterable[str] | None = None) -> dict[str, Output]:
+    """
+    Returns the outputs of the layout, only the named ones with tables.
+    Raises ValueError for a name that is not an output of the layout.
+    """
+    outputs = LAYOUTS[layout]
+    if tables is None:
+        return outputs
+
+    tables = list(tables)
+    unknown = [output_name for output_name in tables if output_name not in outputs]
+    if unknown:
+        raise ValueError(f"Unknown tables {', '.join(unknown)} for the {layout} layout, expected some of {', '.join(outputs)}")
+
+    # written in the layout order whatever the order of the names
+    return {output_name: output for output_name, output in outputs.items() if output_name in tables}
+
+
+def _extract_file_isolated(
+    file_path: pathlib.Path,
+    engine: str,
+    prefetched: concurrent.futures.Future | None = None,
+    table_names: tuple[str, ...] | None = None,
+) -> tuple[dict[str, list[dict]] | None, dict[str, float], checkpoint.FileError | None]:
+    # runs in the workers, the traceback is formatted here since it cannot be sent back to the main process
+    started = time.perf_counter()
+    try:
+        rows, timings = extract_file(file_path, engine=engine, prefetched=prefetched, table_names=table_names)
+    except Exception as e:
+        file_error = checkpoint.FileError(type(e).__name__, str(e), traceback.format_exc())
+        return None, {"extract": time.perf_counter() - started}, file_error
+
+    return rows, timings, None
+
+
+def extract_files(
+    xml_files: typing.Iterable[scanner.ScannedFile],
+    workers: int = 1,
+    engine: str = "minidom",
+    run_metrics: metrics.Metrics | None = None,
+    quarantine: checkpoint.Quarantine | None = None,
+    read_ahead: int = READ_AHEAD,
+    table_names: tuple[str, ...] | None = None,
+) -> typing.Generator[tuple[scanner.ScannedFile, dict[str, list[dict]] | None], None, None]:
+    """
+    Yields the rows of every file in the order of xml_files, with workers > 1 the files are parsed in a process pool,
+    biggest first within every window of workers * FILES_PER_WORKER files (see _submit_window).
+    With a quarantine a file that fails is reported there and yielded with None rows instead of stopping the run.
+    The next read_ahead files are read while the current ones are parsed.
+    With table_names only those tables are extracted, see extract_file.
+    """
+    for xml_file, (rows, timings, file_error) in _extract_files(xml_files, workers, engine, read_ahead, table_names):
+        if file_error is not None:
+            if quarantine is None:
+                raise RuntimeError(f"Failed to extract {xml_file.path}\n{file_error.traceback}")
+
+            quarantine.add(xml_file.path, file_error)
+
+        if run_metrics is not None:
+            run_metrics.file_done(xml_file.path, xml_file.size, timings, failed=file_error is not None)
+
+        yield xml_file, rows
+
+
+def _extract_files(
+    xml_files: typing.Iterable[scanner.ScannedFile],
+    workers: int,
+    engine: str,
+    read_ahead: int,
+    table_names: tuple[str, ...] | None = None,
+) -> typing.Generator[tuple[scanner.ScannedFile, tuple], None, None]:
+    if workers <= 1:
+        for xml_file, prefetched in scanner.read_ahead(xml_files, depth=read_ahead):
+            yield xml_file, _extract_file_isolated(xml_file.path, engine, prefetched, table_names)
+        return
+
+    # the contents can not be handed to the workers cheaply, the page cache is warmed for them instead
+    with (
+        concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor,
+        concurrent.futures.ThreadPoolExecutor(max_workers=max(read_ahead, 1)) as warmer,
+    ):
+        windows = _windows(xml_files, window_size=workers * FILES_PER_WORKER)
+
+        # keep the next window queued while the current one is drained so the workers never run dry
+        for window in _submit_windows(executor, windows, engine, warmer if read_ahead > 0 else None, table_names):
+            for xml_file, future in window:
+                yield xml_file, future.result()
+
+
+def _windows(
+    xml_files: typing.Iterable[scanner.ScannedFile], window_size: int
+) -> typing.Generator[list[scanner.ScannedFile], None, None]:
+    window = []
+    for xml_file in xml_files:
+        window.append(xml_file)
+        if len(window) == window_size:
+            yield window
+            window = []
+
+    if window:
+        yield window
+
+
+def _submit_windows(
+    executor: concurrent.futures.Executor,
+    windows: typing.Iterator[list[scanner.ScannedFile]],
+    engine: str,
+    warmer: concurrent.futures.Executor | None = None,
+    table_names: tuple[str, ...] | None = None,
+) -> typing.Generator[list[tuple[scanner.ScannedFile, concurrent.futures.Future]], None, None]:
+    pending = _submit_window(executor, next(windows, []), engine, warmer, table_names)
+    for window in windows:
+        following = _submit_window(executor, window, engine, warmer, table_names)
+        yield pending
+        pending = following
+
+    yield pending
+
+
+def _submit_window(
+    executor: concurrent.futures.Executor,
+    window: list[scanner.ScannedFile],
+    engine: str,
+    warmer: concurrent.futures.Executor | None = None,
+    table_names: tuple[str, ...] | None = None,
+) -> list[tuple[scanner.ScannedFile, concurrent.futures.Future]]:
+    # biggest files first so a huge filing does not end up alone at the tail of the window. Only the window is sorted:
+    # the results are handed back in scan order, sorting all the files would keep every finished one in memory until
+    # the files before it are done, so a huge file at the very end of the scan can still finish last.
+    futures = {}
+    for xml_file in sorted(window, key=lambda xml_file: xml_file.size, reverse=True):
+        futures[xml_file] = executor.submit(_extract_file_isolated, xml_file.path, engine, None, table_names)
+
+        # a hint only, a file that can not be read fails in its worker
+        if warmer is not None:
+            warmer.submit(scanner.will_need, xml_file.path)
+
+    # hand the results back in the original scan order
+    return [(xml_file, futures[xml_file]) for xml_file in window]
+
+
+def run(
+    base_path: pathlib.Path,
+    output_path: pathlib.Path,
+    workers: int = 1,
+    engine: str = "minidom",
+    incremental: bool = False,
+    use_hash: bool = False,
+    output_format: str = "csv",
+    scan_workers: int = 8,
+    file_index: bool = False,
+    eins: set[str] | None = None,
+    years: set[int] | None = None,
+    forms: set[str] | None = None,
+    resume: bool = False,
+    layout: str = "denormalized",
+    deduplicate: bool = False,
+    read_ahead: int = READ_AHEAD,
+    shard: shards.Shard | None = None,
+    tables: typing.Iterable[str] | None = None,
+) -> None:
+    """
+    Scans and parses every XML file once and feeds the document to all the registered tables.
+    In incremental mode only new or changed files are parsed, the rest of the rows come from the manifest.
+    With EIN, year or form filters only the files whose header matches (according to the catalog) are parsed.
+    With deduplicate copies of a file and all but the latest return per EIN, tax period and form are never parsed.
+    Files that fail are listed in the quarantine report, csv runs save checkpoints and can be resumed.
+    The layout picks the written tables, see LAYOUTS, tables only writes some of them and skips the extractors
+    of the others (incremental runs still extract every table so the manifest can serve any later run).
+    A shard only parses its slice of the files and writes everything into its own directory of output_path,
+    together with the scan position of every file so shards.merge can restore the order of a single run.
+    """
+    if resume and (incremental or output_format != "csv"):
+        raise ValueError("Only non-incremental csv runs can be resumed, incremental runs keep their progress in the manifest")
+
+    outputs = select_outputs(layout, tables)
+
+    if shard is not None:
+        output_path = shards.shard_dir(output_path, shard)
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    run_metrics = metrics.Metrics()
+    # written again at the very end, the metrics of an earlier run would pass this one as finished (see shards.is_finished)
+    output_path.joinpath(metrics.METRICS_FILE).unlink(missing_ok=True)
+
+    started = time.perf_counter()
+    index_file = output_path.joinpath(scanner.INDEX_FILE) if file_index else None
+    # archives that could not be listed and files whose header could not be read, they go into the quarantine report
+    # once it is opened
+    broken_archives: list[tuple[pathlib.Path, Exception]] = []
+    scanned_files = scanner.scan_xml_entries(base_path, workers=scan_workers, index_file=index_file, failed=broken_archives)
+    unreadable: list[tuple[pathlib.Path, checkpoint.FileError]] = [
+        (archive_path, checkpoint.file_error(e)) for archive_path, e in broken_archives
+    ]
+
+    positions = None
+    if shard is not None:
+        positions = {xml_file.path: position for position, xml_file in enumerate(scanned_files)}
+        scanned_files = shards.select_files(scanned_files, base_path, shard)
+
+    xml_files = scanned_files
+    if eins or years or forms or deduplicate:
+        with catalog.Catalog(output_path.joinpath(catalog.CATALOG_FILE), base_path=base_path) as filing_catalog:
+            cataloged = filing_catalog.update(scanned_files, workers=scan_workers, use_hash=deduplicate, failed=unreadable)
+
+        if deduplicate:
+            cataloged, duplicates = dedup.resolve(cataloged)
+            dedup.write_report(output_path.joinpath(dedup.DUPLICATES_FILE), duplicates)
+            run_metrics.files_skipped("duplicate", len(duplicates))
+
+        xml_files = catalog.select_files(cataloged, eins=eins or set(), years=years or set(), forms=forms or set())
+    run_metrics.add_time("scan", time.perf_counter() - started)
+
+    quarantine_file = output_path.joinpath(checkpoint.QUARANTINE_FILE)
+
+    if not incremental:
+        checkpoint_file = output_path.joinpath(checkpoint.CHECKPOINT_FILE)
+
+        resume_from = None
+        if resume:
+            table_names = [*outputs, *([shards.ORDER_TABLE] if shard is not None else [])]
+            resume_from = checkpoint.load(checkpoint_file, xml_files, table_names=table_names)
+        else:
+            # the outputs are written from scratch, a checkpoint of an older run does not apply to them
+            checkpoint_file.unlink(missing_ok=True)
+
+        if resume_from is not None:
+            xml_files = xml_files[resume_from.files :]
+
+        with checkpoint.Quarantine(quarantine_file, offset=resume_from.quarantine if resume_from else None) as quarantine:
+            # a resumed run finds them in the part of the report it continues
+            if resume_from is None:
+                _quarantine_unreadable(quarantine, unreadable, run_metrics)
+
+            run_metrics.expect(len(xml_files), sum(xml_file.size for xml_file in xml_files))
+            extracted = extract_files(
+                xml_files,
+                workers=workers,
+                engine=engine,
+                run_metrics=run_metrics,
+                quarantine=quarantine,
+                read_ahead=read_ahead,
+                table_names=required_tables(outputs),
+            )
+
+            checkpointer = None
+            if output_format == "csv":
+                checkpointer = checkpoint.Checkpointer(checkpoint_file, quarantine, resume_from=resume_from)
+
+            write_tables(
+                output_path,
+                extracted,
+                output_format=output_format,
+                run_metrics=run_metrics,
+                checkpointer=checkpointer,
+                offsets=resume_from.offsets if resume_from else None,
+                layout=layout,
+                base_path=base_path,
+                positions=positions,
+                tables=list(outputs),
+            )
+
+    else:
+        with (
+            manifest.Manifest(output_path.joinpath(manifest.MANIFEST_FILE), base_path=base_path, use_hash=use_hash) as cache,
+            checkpoint.Quarantine(quarantine_file) as quarantine,
+        ):
+            _quarantine_unreadable(quarantine, unreadable, run_metrics)
+
+            changed_files = cache.changed_files(xml_files)
+            run_metrics.expect(len(changed_files), sum(xml_file.size for xml_file in changed_files))
+            extracted = extract_files(
+                changed_files, workers=workers, engine=engine, run_metrics=run_metrics, quarantine=quarantine, read_ahead=read_ahead
+            )
+
+            cached = manifest.cached_extract(cache, xml_files, extracted, scanned_files)
+            write_tables(
+                output_path,
+                cached,
+                output_format=output_format,
+                run_metrics=run_metrics,
+                layout=layout,
+                base_path=base_path,
+                positions=positions,
+                tables=list(outputs),
+            )
+
+    run_metrics.dump(output_path.joinpath(metrics.METRICS_FILE))
+
+
+def _quarantine_unreadable(
+    quarantine: checkpoint.Quarantine,
+    unreadable: list[tuple[pathlib.Path, checkpoint.FileError]],
+    run_metrics: metrics.Metrics,
+) -> None:
+    for file_path, file_error in unreadable:
+        quarantine.add(file_path, file_error)
+
+    if unreadable:
+        run_metrics.files_skipped("unreadable", len(unreadable))
+
+
+def write_tables(
+    output_path: pathlib.Path,
+    extracted: typing.Iterable[tuple[scanner.ScannedFile, dict[str, list[dict]] | None]],
+    output_format: str = "csv",
+    run_metrics: metrics.Metrics | None = None,
+    checkpointer: checkpoint.Checkpointer | None = None,
+    offsets: dict[str, int] | None = None,
+    layout: str = "denormalized",
+    base_path: pathlib.Path | None = None,
+    positions: dict[pathlib.Path, int] | None = None,
+    tables: typing.Iterable[str] | None = None,
+) -> None:
+    """
+    Streams the rows of every file into the table outputs as they come, nothing is collected in memory.
+    Files that failed come with None rows and are skipped. With offsets the outputs of an interrupted run are continued.
+    Filing ids are made from the file paths relative to base_path.
+    With positions (sharded runs) the scan position and row counts of every written file go into the order file.
+    With tables only those outputs of the layout are written.
+    """
+    outputs = select_outputs(layout, tables)
+
+    offsets = offsets or {}
+    sinks = {
+        output_name: printer.open_sink(
+            output_path,
+            output_name,
+            columns=output.columns,
+            partition_columns=output.partition_columns,
+            file_format=output_format,
+            offset=offsets.get(output_name),
+            key_columns=output.key_columns,
+        )
+        for output_name, output in outputs.items()
+    }
+    if positions is not None:
+        sinks[shards.ORDER_TABLE] = printer.CsvSink(
+            output_path.joinpath(shards.ORDER_FILE), columns=[shards.POSITION, *outputs], offset=offsets.get(shards.ORDER_TABLE)
+        )
+
+    try:
+        for xml_file, rows in extracted:
+            started = time.perf_counter()
+            if rows is not None:
+                for output_name, table_rows in layout_rows(outputs, rows, filing_id(xml_file.path, base_path)).items():
+                    sinks[output_name].write(table_rows)
+
+                # every output has one row per extracted row of its table
+                counts = {output_name: len(rows.get(output.table_name, [])) for output_name, output in outputs.items()}
+                if run_metrics is not None:
+                    for output_name, count in counts.items():
+                        run_metrics.rows_written(output_name, count)
+
+                if positions is not None:
+                    sinks[shards.ORDER_TABLE].write([{shards.POSITION: positions[xml_file.path], **counts}])
+
+            if checkpointer is not None:
+                checkpointer.file_done(xml_file, sinks)
+
+            if run_metrics is not None:
+                run_metrics.add_time("write", time.perf_counter() - started)
+    finally:
+        started = time.perf_counter()
+        for sink in sinks.values():
+            sink.close()
+
+        if run_metrics is not None:
+            run_metrics.add_time("write", time.perf_counter() - started)
+
+    if checkpointer is not None:
+        checkpointer.finish()
+
+
+def layout_rows(outputs: dict[str, Output], rows: dict[str, list[dict]], file_id: str) -> dict[str, typing.Iterable[dict]]:
+    """
+    Returns the rows of every output from the extracted rows of one file, the linked rows are made one at a time
+    while the sink consumes them
+    """
+    # a single row per file, empty when the filings table was not extracted
+    filing = next(iter(rows.get("filings", [])), {})
+
+    output_rows = {}
+    for output_name, output in outputs.items():
+        table_rows = rows.get(output.table_name, [])
+
+        if output.link == LINK_JOIN:
+            output_rows[output_name] = ({**filing, **row} for row in table_rows)
+        elif output.link == LINK_KEY:
+            output_rows[output_name] = ({filings.FILING_ID: file_id, **row} for row in table_rows)
+        else:
+            output_rows[output_name] = table_rows
+
+    return output_rows
+
+
+def filing_id(file_path: pathlib.Path, base_path: pathlib.Path | None = None) -> str:
+    """
+    Returns the surrogate key of a filing, a short hash of its path which stays the same over runs
+    """
+    if base_path is not None:
+        file_path = pathlib.Path(file_path).relative_to(base_path)
+
+    return hashlib.blake2b(pathlib.PurePath(file_path).as_posix().encode(), digest_size=8).hexdigest()
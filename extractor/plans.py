@@ -0,0 +1,159 @@
+from datetime import datetime, date
+import typing
+from xml.dom.minidom import Document
+
+from extractor import schemas, utils
+
+# path prefixes shared by the field specs of every table
+HEADER_PATH = "Return/ReturnHeader"
+FILER_PATH = f"{HEADER_PATH}/Filer"
+FILER_ADDRESS_PATH = f"{FILER_PATH}/USAddress"
+RETURN_DATA_PATH = "Return/ReturnData"
+
+
+class Field(typing.NamedTuple):
+    """
+    One output column read from the element at path, e.g. Field(CHARITY_EIN, "Return/ReturnHeader/Filer/EIN").
+    A missing optional field becomes an empty string, a missing required one fails like extract_single_tag does.
+    """
+
+    column: str
+    path: str
+    optional: bool = False
+    convert: typing.Callable[[str], typing.Any] | None = None
+
+
+class PlanNode(typing.NamedTuple):
+    # fields whose value is the text of this element
+    fields: list[Field]
+    # paths that must exist for the plan to return a row at all
+    guards: list[str]
+    children: dict[str, "PlanNode"]
+
+
+class Plan(typing.NamedTuple):
+    # trie of the current schema
+    root: PlanNode
+    columns: list[str]
+    fields: list[Field]
+    guards: list[str]
+    # tries of the older schemas, compiled the first time a document of that schema comes along
+    schema_roots: dict[int, PlanNode]
+
+
+def compile_plan(fields: list[Field], guards: list[str] | None = None) -> Plan:
+    """
+    Builds a trie of the field paths so a single walk of the document fills every column.
+    When one of the guard paths is missing the plan gives None instead of a row.
+    The paths use the tag names of the current schema, documents of an older schema are walked
+    with a trie of the renamed paths (see schemas.TAG_OVERRIDES).
+    """
+    guards = guards or []
+    root = _compile_root(fields, guards, schemas.CURRENT_SCHEMA)
+
+    return Plan(
+        root=root,
+        columns=[field.column for field in fields],
+        fields=fields,
+        guards=guards,
+        schema_roots={schemas.CURRENT_SCHEMA: root},
+    )
+
+
+def filing_year(tax_period_begin_text: str) -> int:
+    tax_period_begin: date = datetime.strptime(tax_period_begin_text, "%Y-%m-%d")
+    return tax_period_begin.year
+
+
+def run_plan(plan: Plan, document: Document) -> dict[str, typing.Any] | None:
+    data = dict.fromkeys(plan.columns)
+
+    schema = schemas.schema_of(utils.extract_return_version(document))
+    root = plan.schema_roots.get(schema)
+    if root is None:
+        root = plan.schema_roots[schema] = _compile_root(plan.fields, plan.guards, schema)
+
+    try:
+        _walk(document, root, data)
+    except _GuardMissing:
+        return None
+
+    return data
+
+
+class _GuardMissing(Exception):
+    pass
+
+
+def _compile_root(fields: list[Field], guards: list[str], schema: int) -> PlanNode:
+    root = _new_node()
+
+    for field in fields:
+        _node_at(root, schemas.rename_path(field.path, schema)).fields.append(field)
+
+    for guard in guards:
+        _node_at(root, schemas.rename_path(guard, schema)).guards.append(guard)
+
+    return root
+
+
+def _new_node() -> PlanNode:
+    return PlanNode(fields=[], guards=[], children={})
+
+
+def _node_at(root: PlanNode, path: str) -> PlanNode:
+    node = root
+    for tag_name in path.split("/"):
+        node = node.children.setdefault(tag_name, _new_node())
+
+    return node
+
+
+def _walk(parent: Document, node: PlanNode, data: dict[str, typing.Any]) -> None:
+    # one pass over the children finds every tag the plan needs at this level
+    found: dict[str, list[Document]] = {}
+    for element in utils.child_elements(parent):
+        tag_name = utils.element_name(element)
+        if tag_name in node.children:
+            found.setdefault(tag_name, []).append(element)
+
+    for tag_name, child_node in node.children.items():
+        elements = found.get(tag_name, [])
+
+        if not elements:
+            _fill_missing(tag_name, child_node, data)
+            continue
+
+        # same rule as extract_single_tag, a planned element must not be repeated
+        assert len(elements) == 1
+        element = elements[0]
+
+        for field in child_node.fields:
+            value = utils.element_value(element, tag_name)
+            data[field.column] = field.convert(value) if field.convert else value
+
+        _walk(element, child_node, data)
+
+
+def _fill_missing(tag_name: str, node: PlanNode, data: dict[str, typing.Any]) -> None:
+    fields, guards = _subtree(node)
+
+    if guards:
+        raise _GuardMissing()
+
+    for field in fields:
+        # the missing element is required by a field of the plan
+        assert field.optional, f"{tag_name} not found for {field.column}"
+        data[field.column] = ""
+
+
+def _subtree(node: PlanNode) -> tuple[list[Field], list[str]]:
+    fields = [*node.fields]
+    guards = [*node.guards]
+
+    for child_node in node.children.values():
+        child_fields, child_guards = _subtree(child_node)
+        fields.extend(child_fields)
+        guards.extend(child_guards)
+
+    return fields, guards
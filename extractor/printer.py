@@ -1,12 +1,265 @@
+import csv
 import pathlib
+import shutil
+import sqlite3
+import typing
 
-import pandas as pd
+# rows held in memory before they are written out, memory stays flat however many rows a table gets
+BATCH_SIZE = 10_000
 
+# file extension of every output format
+FORMATS = {
+    "csv": "csv",
+    "parquet": "parquet",
+    "arrow": "arrow",
+    "sqlite": "sqlite",
+}
 
-def to_csv(target_file: pathlib.Path, data: list[dict]) -> None:
-    df = pd.DataFrame.from_records(data)
+# every table of the sqlite format goes into this database in the output directory
+DATABASE_FILE = "tables.sqlite"
 
-    print(df.head(5))
+# columns with a single column index in every sqlite table that has them
+INDEX_COLUMNS = ["Filing Year", "Type"]
 
-    with open(target_file, "w") as f:
-        df.to_csv(f, index=False)
+
+class CsvSink:
+    """
+    Writes rows into a CSV file in fixed size batches, the header comes from the declared columns of the table.
+    With an offset the file of an interrupted run is cut back to it and continued.
+    """
+
+    def __init__(self, target_file: pathlib.Path, columns: list[str], batch_size: int = BATCH_SIZE, offset: int | None = None):
+        self.columns = columns
+        self.batch_size = batch_size
+        self.batch: list[dict] = []
+
+        if offset is None:
+            self.file = open(target_file, "w", newline="")
+        else:
+            self.file = open(target_file, "r+", newline="")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, restval="", lineterminator="\n")
+        if offset is None:
+            self.writer.writeheader()
+
+    def __enter__(self) -> "CsvSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, rows: typing.Iterable[dict]) -> None:
+        for row in rows:
+            self.batch.append(row)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        # a column missing from the schema raises here instead of silently changing the header
+        self.writer.writerows(self.batch)
+        self.batch = []
+        self.file.flush()
+
+    def offset(self) -> int:
+        """
+        Flushes the batch and returns the size of the written file
+        """
+        self.flush()
+        return self.file.tell()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class PartitionedSink:
+    """
+    Writes rows into a Parquet or Arrow IPC dataset under target_dir with one directory per partition value,
+    e.g. Filing Year=2020/Type=990PF/part-0.parquet. Every partition gets row groups of at most batch_size rows.
+    """
+
+    def __init__(
+        self,
+        target_dir: pathlib.Path,
+        columns: list[str],
+        partition_columns: list[str],
+        file_format: str = "parquet",
+        batch_size: int = BATCH_SIZE,
+    ):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f"pyarrow is required for {file_format} output, install it with: pip install pyarrow")
+
+        self.pyarrow = pyarrow
+        self.target_dir = target_dir
+        self.partition_columns = partition_columns
+        self.file_format = file_format
+        self.batch_size = batch_size
+
+        # the partition values live in the directory names, all the extracted values are text
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in columns if column not in partition_columns])
+
+        self.batches: dict[tuple, list[dict]] = {}
+        self.writers: dict[tuple, typing.Any] = {}
+
+        # partitions of a previous run would otherwise be mixed into this one
+        if target_dir.exists():
+            shutil.rmtree(target_dir)
+
+    def __enter__(self) -> "PartitionedSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, rows: typing.Iterable[dict]) -> None:
+        for row in rows:
+            partition = tuple(row[column] for column in self.partition_columns)
+
+            batch = self.batches.setdefault(partition, [])
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.flush_partition(partition)
+
+    def flush_partition(self, partition: tuple) -> None:
+        table = self.pyarrow.Table.from_pylist(self.batches[partition], schema=self.schema)
+        self.batches[partition] = []
+
+        if partition not in self.writers:
+            self.writers[partition] = self.open_writer(partition)
+
+        self.writers[partition].write_table(table)
+
+    def open_writer(self, partition: tuple):
+        partition_dir = self.target_dir
+        for column, value in zip(self.partition_columns, partition):
+            partition_dir = partition_dir.joinpath(f"{column}={value}")
+
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        target_file = partition_dir.joinpath(f"part-0.{FORMATS[self.file_format]}")
+
+        if self.file_format == "parquet":
+            import pyarrow.parquet
+
+            return pyarrow.parquet.ParquetWriter(target_file, self.schema)
+
+        return self.pyarrow.ipc.new_file(target_file, self.schema)
+
+    def close(self) -> None:
+        for partition, batch in self.batches.items():
+            if batch:
+                self.flush_partition(partition)
+
+        for writer in self.writers.values():
+            writer.close()
+
+
+class SqliteSink:
+    """
+    Writes rows into a table of a SQLite database, every batch is inserted with executemany in one transaction.
+    Rows are replaced per key (e.g. EIN, filing year and form type): the first time a key shows up in a run
+    the rows a previous run stored under it are deleted, so re-runs do not duplicate them.
+    The indexes are created once the rows are loaded.
+    """
+
+    def __init__(self, database_file: pathlib.Path, table_name: str, columns: list[str], key_columns: list[str], batch_size: int = BATCH_SIZE):
+        self.table_name = table_name
+        self.columns = columns
+        self.key_columns = key_columns
+        self.batch_size = batch_size
+        self.batch: list[dict] = []
+        self.seen_keys: set[tuple] = set()
+
+        self.connection = sqlite3.connect(database_file)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+
+        existing_columns = [name for _, name, *_ in self.connection.execute(f"PRAGMA table_info({_quote(table_name)})")]
+        if existing_columns and existing_columns != columns:
+            # written by another layout or version, its rows can not be replaced by key
+            self.connection.execute(f"DROP TABLE {_quote(table_name)}")
+            existing_columns = []
+
+        # a new table has nothing to replace, the deletes are skipped for the whole run
+        self.replace = bool(existing_columns)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table_name)} ({', '.join(f'{_quote(column)} TEXT' for column in columns)})")
+        self.connection.commit()
+
+        key_condition = " AND ".join(f"{_quote(column)} = ?" for column in key_columns)
+        self.delete_statement = f"DELETE FROM {_quote(table_name)} WHERE {key_condition}"
+        self.insert_statement = f"INSERT INTO {_quote(table_name)} VALUES ({', '.join('?' for _ in columns)})"
+
+    def __enter__(self) -> "SqliteSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, rows: typing.Iterable[dict]) -> None:
+        for row in rows:
+            self.batch.append(row)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        new_keys = []
+        for row in self.batch:
+            key = tuple(row.get(column) for column in self.key_columns)
+            if key not in self.seen_keys:
+                self.seen_keys.add(key)
+                new_keys.append(key)
+
+        with self.connection:
+            if self.replace:
+                self.connection.executemany(self.delete_statement, new_keys)
+
+            self.connection.executemany(self.insert_statement, [tuple(row.get(column) for column in self.columns) for row in self.batch])
+
+        self.batch = []
+
+    def close(self) -> None:
+        self.flush()
+
+        # the key index also serves lookups by EIN, the filing year and form type get their own
+        indexes = {"key": self.key_columns, **{column: [column] for column in INDEX_COLUMNS if column in self.columns}}
+        with self.connection:
+            for index_name, index_columns in indexes.items():
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(f'{self.table_name}_{index_name}'.lower().replace(' ', '_'))}"
+                    f" ON {_quote(self.table_name)} ({', '.join(_quote(column) for column in index_columns)})"
+                )
+
+        self.connection.close()
+
+
+def _quote(name: str) -> str:
+    # the column names have spaces and slashes
+    return '"' + name.replace('"', '""') + '"'
+
+
+def open_sink(
+    output_path: pathlib.Path,
+    table_name: str,
+    columns: list[str],
+    partition_columns: list[str],
+    file_format: str = "csv",
+    offset: int | None = None,
+    key_columns: list[str] | None = None,
+):
+    """
+    Returns the sink writing one table in the given format, csv goes into a single file, sqlite into a table of
+    the shared database and the others into a partitioned directory.
+    Only csv outputs can be continued from an offset, only sqlite uses the key columns.
+    """
+    if file_format == "csv":
+        return CsvSink(output_path.joinpath(f"{table_name}.csv"), columns=columns, offset=offset)
+
+    if file_format == "sqlite":
+        return SqliteSink(output_path.joinpath(DATABASE_FILE), table_name, columns=columns, key_columns=key_columns or columns)
+
+    return PartitionedSink(
+        output_path.joinpath(table_name), columns=columns, partition_columns=partition_columns, file_format=file_format
+    )
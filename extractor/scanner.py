@@ -1,18 +1,300 @@
+import collections
+import concurrent.futures
+import datetime
+import functools
+import gzip
+import json
+import mmap
 import os
 import pathlib
 import typing
+import zipfile
 
+from extractor import utils
 
-def scan_xml_files(base_dir: pathlib.Path) -> typing.Generator[pathlib.Path, None, None]:
-    yield from _scan(base_dir)
+# members of an archive are reported as archive.zip!member.xml
+ARCHIVE_SEPARATOR = "!"
+ARCHIVE_SUFFIX = ".zip"
 
+INDEX_FILE = "file_index.json.gz"
+INDEX_VERSION = 1
 
-def _scan(base_dir: pathlib.Path):
-    for entry in os.scandir(base_dir):
+# plain files at least this big are memory-mapped instead of copied into memory
+MMAP_SIZE = 16 * 2**20
+
+# directory listing entries, a subdirectory is (name, None, None) and a file (name, size, mtime_ns)
+Listing = list[tuple[str, int | None, int | None]]
+
+
+class ScannedFile(typing.NamedTuple):
+    path: pathlib.Path
+    size: int
+    mtime_ns: int
+
+
+def scan_xml_entries(
+    base_dir: pathlib.Path,
+    workers: int = 8,
+    index_file: pathlib.Path | None = None,
+    failed: list[tuple[pathlib.Path, Exception]] | None = None,
+) -> list[ScannedFile]:
+    """
+    Lists the directories on a thread pool and returns the files with the size and mtime the listing already gave,
+    in scan order. With an index file, directories whose mtime did not change since the last
+    scan are not listed again (files rewritten in place, without touching their directory, are not noticed then).
+    With failed an archive that can not be listed is appended there and left out, see list_directories.
+    """
+    index = load_index(index_file, base_dir) if index_file is not None else {}
+    listings = list_directories(base_dir, workers=workers, index=index, failed=failed)
+
+    if index_file is not None:
+        save_index(index_file, base_dir, listings)
+
+    return list(_flatten(base_dir, "", listings))
+
+
+def list_directories(
+    base_dir: pathlib.Path,
+    workers: int = 8,
+    index: dict[str, tuple[int, Listing]] | None = None,
+    changed: set[str] | None = None,
+    failed: list[tuple[pathlib.Path, Exception]] | None = None,
+) -> dict[str, tuple[int, Listing]]:
+    """
+    Returns the mtime and listing of every directory under base_dir (keyed by its path relative to base_dir),
+    the ones of the index are reused as they are for directories whose mtime did not change.
+    With changed the directories that were listed again are added to it.
+    With failed an archive that can not be listed (e.g. corrupt or still being copied) is appended there with the error
+    instead of stopping the scan. It is left out of the listing and its directory is listed again by the next scan.
+    """
+    index = index or {}
+    listings: dict[str, tuple[int, Listing]] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_list_directory, base_dir, "", index, failed): ""}
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                relative_dir = pending.pop(future)
+                listings[relative_dir] = future.result()
+                if changed is not None and listings[relative_dir] is not index.get(relative_dir):
+                    changed.add(relative_dir)
+
+                # fan out over the subdirectories as soon as their parent is listed
+                for name, size, _ in listings[relative_dir][1]:
+                    if size is None:
+                        child_dir = _join(relative_dir, name)
+                        pending[executor.submit(_list_directory, base_dir, child_dir, index, failed)] = child_dir
+
+    return listings
+
+
+def _join(relative_dir: str, name: str) -> str:
+    return f"{relative_dir}/{name}" if relative_dir else name
+
+
+def _list_directory(
+    base_dir: pathlib.Path,
+    relative_dir: str,
+    index: dict[str, tuple[int, Listing]],
+    failed: list[tuple[pathlib.Path, Exception]] | None = None,
+) -> tuple[int, Listing]:
+    dir_path = base_dir.joinpath(relative_dir)
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+
+    if relative_dir in index and index[relative_dir][0] == mtime_ns:
+        return index[relative_dir]
+
+    listing: Listing = []
+    for entry in os.scandir(dir_path):
         if entry.is_dir():
-            child_dir = base_dir.joinpath(entry.name)
-            yield from _scan(child_dir)
+            listing.append((entry.name, None, None))
 
         elif entry.name.endswith(".xml"):
-            yield pathlib.Path(entry.path)
+            stat = entry.stat()
+            listing.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        elif entry.name.endswith(ARCHIVE_SUFFIX):
+            try:
+                member_paths = list(scan_archive(pathlib.Path(entry.path)))
+            except (zipfile.BadZipFile, OSError) as e:
+                if failed is None:
+                    raise
+
+                failed.append((pathlib.Path(entry.path), e))
+                # an mtime no directory has, the index never passes the listing as current
+                mtime_ns = -1
+                continue
+
+            for member_path in member_paths:
+                size, member_mtime_ns = file_stat(member_path)
+                listing.append((f"{entry.name}{ARCHIVE_SEPARATOR}{split_archive_path(member_path)[1]}", size, member_mtime_ns))
+
+    return mtime_ns, listing
+
+
+def _flatten(
+    base_dir: pathlib.Path, relative_dir: str, listings: dict[str, tuple[int, Listing]]
+) -> typing.Generator[ScannedFile, None, None]:
+    # depth first in listing order, the same order the recursive scan yields
+    for name, size, mtime_ns in listings[relative_dir][1]:
+        if size is None:
+            yield from _flatten(base_dir, _join(relative_dir, name), listings)
+        else:
+            yield ScannedFile(base_dir.joinpath(relative_dir, name), size, mtime_ns)
+
+
+def load_index(index_file: pathlib.Path, base_dir: pathlib.Path) -> dict[str, tuple[int, Listing]]:
+    if not index_file.exists():
+        return {}
+
+    with gzip.open(index_file, "rt") as f:
+        index = json.load(f)
+
+    if index["version"] != INDEX_VERSION or index["base_dir"] != str(base_dir):
+        return {}
+
+    return {
+        relative_dir: (mtime_ns, [tuple(entry) for entry in listing])
+        for relative_dir, (mtime_ns, listing) in index["directories"].items()
+    }
+
+
+def save_index(index_file: pathlib.Path, base_dir: pathlib.Path, listings: dict[str, tuple[int, Listing]]) -> None:
+    index = {"version": INDEX_VERSION, "base_dir": str(base_dir), "directories": listings}
+
+    with utils.replace_file(index_file, "wt", opener=gzip.open) as f:
+        json.dump(index, f, separators=(",", ":"))
+
+
+def scan_archive(archive_path: pathlib.Path) -> typing.Generator[pathlib.Path, None, None]:
+    """
+    Lists the XML members of an IRS bulk archive, nothing is unpacked
+    """
+    for member in open_archive(archive_path).infolist():
+        if not member.is_dir() and member.filename.endswith(".xml"):
+            yield pathlib.Path(f"{archive_path}{ARCHIVE_SEPARATOR}{member.filename}")
+
+
+def scan_archive_entries(archive_path: pathlib.Path) -> list[ScannedFile]:
+    """
+    Returns the XML members of an IRS bulk archive with their size and mtime, like scan_xml_entries does for a directory
+    """
+    return [ScannedFile(member_path, *file_stat(member_path)) for member_path in scan_archive(archive_path)]
+
+
+def open_archive(archive_path: pathlib.Path) -> zipfile.ZipFile:
+    # forked workers must not share the file offset of an archive opened by the parent
+    return _open_archive(archive_path, os.getpid())
+
+
+@functools.lru_cache(maxsize=16)
+def _open_archive(archive_path: pathlib.Path, pid: int) -> zipfile.ZipFile:
+    # reading the central directory of a big archive is expensive, keep the recently used ones open
+    return zipfile.ZipFile(archive_path)
+
+
+def split_archive_path(file_path: pathlib.Path) -> tuple[pathlib.Path, str] | None:
+    """
+    Returns the archive and the member name of an archive.zip!member.xml path, None for a plain file
+    """
+    archive_path, separator, member_name = str(file_path).partition(f"{ARCHIVE_SUFFIX}{ARCHIVE_SEPARATOR}")
+    if not separator:
+        return None
+
+    return pathlib.Path(f"{archive_path}{ARCHIVE_SUFFIX}"), member_name
+
+
+def open_file(file_path: pathlib.Path) -> typing.BinaryIO:
+    """
+    Opens a scanned file for binary reading, archive members are streamed out of the archive without temp files
+    """
+    archive_member = split_archive_path(file_path)
+    if archive_member is None:
+        return open(file_path, "rb")
+
+    archive_path, member_name = archive_member
+    return open_archive(archive_path).open(member_name)
+
+
+def read_file(file_path: pathlib.Path) -> bytes:
+    with open_file(file_path) as f:
+        return f.read()
+
+
+def load_file(file_path: pathlib.Path) -> bytes | mmap.mmap:
+    """
+    Returns the raw bytes of a scanned file for the parser, expat detects the encoding from the XML declaration.
+    Big plain files are memory-mapped and their pages read ahead by the kernel, the caller closes the map.
+    """
+    if split_archive_path(file_path) is not None:
+        return read_file(file_path)
+
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_SIZE:
+            return f.read()
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # madvise is missing on some platforms, the map still works without the hints
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+        mapped.madvise(mmap.MADV_WILLNEED)
+
+    return mapped
+
+
+def read_ahead(
+    xml_files: typing.Iterable[ScannedFile], depth: int = 8
+) -> typing.Generator[tuple[ScannedFile, concurrent.futures.Future | None], None, None]:
+    """
+    Yields every file with the future of its contents, the next depth files are loaded on a thread pool
+    while the current one is parsed. With depth 0 nothing is loaded and None is yielded instead.
+    """
+    if depth < 1:
+        for xml_file in xml_files:
+            yield xml_file, None
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=depth) as executor:
+        pending: collections.deque[tuple[ScannedFile, concurrent.futures.Future]] = collections.deque()
+        for xml_file in xml_files:
+            pending.append((xml_file, executor.submit(load_file, xml_file.path)))
+            if len(pending) > depth:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
+
+
+def will_need(file_path: pathlib.Path) -> None:
+    """
+    Asks the kernel to start reading a plain file into the page cache, the parser then finds it there
+    """
+    if split_archive_path(file_path) is not None or not hasattr(os, "posix_fadvise"):
+        return
+
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def file_stat(file_path: pathlib.Path) -> tuple[int, int]:
+    """
+    Returns the size and the modification time (in ns) of a scanned file
+    """
+    archive_member = split_archive_path(file_path)
+    if archive_member is None:
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    archive_path, member_name = archive_member
+    member = open_archive(archive_path).getinfo(member_name)
+    modified = datetime.datetime(*member.date_time)
+
+    return member.file_size, int(modified.timestamp()) * 1_000_000_000
 
@@ -0,0 +1,127 @@
+import functools
+import re
+
+# tag names of the schemas before 2013 (returnVersion 2009v1.0 to 2012v2.3), keyed by the current tag name.
+# A "parent/child" key renames the child only under that parent, it wins over the plain key of the child.
+LEGACY_TAGS: dict[str, str] = {
+    # return header
+    "TaxPeriodBeginDt": "TaxPeriodBeginDate",
+    "TaxPeriodEndDt": "TaxPeriodEndDate",
+    "ReturnTypeCd": "ReturnType",
+    "ReturnTs": "Timestamp",
+    "BusinessName": "Name",
+    "BusinessNameLine1Txt": "BusinessNameLine1",
+    "PhoneNum": "Phone",
+    "AddressLine1Txt": "AddressLine1",
+    "AddressLine2Txt": "AddressLine2",
+    "CityNm": "City",
+    "StateAbbreviationCd": "State",
+    "ZIPCd": "ZIPCode",
+    "BusinessOfficerGrp": "Officer",
+    "PersonNm": "Name",
+    "PersonTitleTxt": "Title",
+    "PreparerFirmGrp": "PreparerFirm",
+    "PreparerFirmName": "PreparerFirmBusinessName",
+    # 990
+    "ActivityOrMissionDesc": "ActivityOrMissionDescription",
+    "TotalEmployeeCnt": "TotalNbrEmployees",
+    "TotalVolunteersCnt": "TotalNbrVolunteers",
+    "IndivRcvdGreaterThan100KCnt": "CntrctRcvdGreaterThan100K",
+    "UnrelatedBusinessRevenueAmt": "TotalGrossUBI",
+    "DonorAdvisedFundInd": "DonorAdvisedFunds",
+    "LocalChaptersInd": "LocalChapters",
+    # 990EZ
+    "TrnsfrExmptNonChrtblRltdOrgInd": "TrnsfrExmptNonChrtblRltdOrgs",
+    # 990PF
+    "FMVAssetsEOYAmt": "FMVAssetsEOY",
+    "OfficerDirTrstKeyEmplInfoGrp": "OfficerDirTrstKeyEmplInfo",
+    "OtherEmployeePaidOver50kCnt": "OtherEmployeePaidOver50k",
+    # staff
+    "Form990PartVIISectionAGrp": "Form990PartVIISectionA",
+    "Form990PartVIISectionAGrp/PersonNm": "NamePerson",
+    "OfficerDirectorTrusteeEmplGrp": "OfficerDirectorTrusteeEmpl",
+    "OfficerDirectorTrusteeEmplGrp/PersonNm": "PersonName",
+    "TitleTxt": "Title",
+    "ReportableCompFromOrgAmt": "ReportableCompFromOrganization",
+    "CompensationAmt": "Compensation",
+    # grants
+    "GrantOrContributionPdDurYrGrp": "GrantOrContributionPdDurYr",
+    "RecipientPersonNm": "RecipientPersonName",
+    "RecipientFoundationStatusTxt": "RecipientFoundationStatus",
+    "GrantOrContributionPurposeTxt": "PurposeOfGrantOrContribution",
+    "Amt": "Amount",
+    "TotalGrantOrContriPdDurYrAmt": "TotalGrantOrContriPdDurYr",
+    # addresses
+    "ProvinceOrStateNm": "ProvinceOrState",
+    "CountryCd": "Country",
+}
+
+# tag renames of the older schemas, newest first: the first returnVersion that no longer needs them
+# and the renames themselves. A version gets the renames of every entry it is older than, the oldest ones win.
+# The tags read by the tables keep their names from 2013v3.0 through 2023v5.0, a later rename goes on top of
+# the list keyed by the returnVersion introducing it (the current names are always those of the newest schemas).
+TAG_OVERRIDES: list[tuple[str, dict[str, str]]] = [
+    ("2013v3.0", LEGACY_TAGS),
+]
+
+# the current schema, documents without a (readable) returnVersion are read with it as well
+CURRENT_SCHEMA = 0
+
+
+@functools.lru_cache(maxsize=None)
+def schema_of(return_version: str | None) -> int:
+    """
+    Returns the schema of a returnVersion (e.g. 2011v1.2), the number of TAG_OVERRIDES entries that apply to it
+    """
+    version = version_key(return_version)
+    if version is None:
+        return CURRENT_SCHEMA
+
+    return sum(1 for first_version, _ in TAG_OVERRIDES if version < version_key(first_version))
+
+
+def version_key(return_version: str | None) -> tuple[int, ...] | None:
+    """
+    Returns a returnVersion as a comparable (year, major, minor), e.g. 2013v3.1 -> (2013, 3, 1), None when it is not one
+    """
+    match = re.match(r"(\d{4})(?:v(\d+)(?:\.(\d+))?)?", return_version or "")
+    if match is None:
+        return None
+
+    return tuple(int(number or 0) for number in match.groups())
+
+
+@functools.lru_cache(maxsize=None)
+def tag_names(schema: int) -> dict[str, str]:
+    """
+    Returns the current tag name -> tag name of the schema renames
+    """
+    renames: dict[str, str] = {}
+    for _, overrides in TAG_OVERRIDES[:schema]:
+        renames.update(overrides)
+
+    return renames
+
+
+def tag_name(current_tag_name: str, schema: int, parent: str | None = None) -> str:
+    """
+    Returns the tag name of the schema, parent is the current tag name of the parent element when it is known
+    """
+    renames = tag_names(schema)
+    if parent is not None:
+        renamed = renames.get(f"{parent}/{current_tag_name}")
+        if renamed is not None:
+            return renamed
+
+    return renames.get(current_tag_name, current_tag_name)
+
+
+def rename_path(path: str, schema: int) -> str:
+    """
+    Returns a slash separated path of current tag names in the tag names of the schema
+    """
+    current_tag_names = path.split("/")
+    return "/".join(
+        tag_name(current_tag_name, schema, parent=current_tag_names[position - 1] if position else None)
+        for position, current_tag_name in enumerate(current_tag_names)
+    )
@@ -0,0 +1,121 @@
+import csv
+import hashlib
+import heapq
+import pathlib
+import typing
+
+from extractor import checkpoint, metrics, scanner
+
+# every shard writes into its own directory of the output directory, e.g. output/shard-2-of-4
+SHARD_DIR = "shard-{shard}-of-{shards}"
+
+# position of every written file in the scan of the whole data directory and its number of rows per table
+ORDER_FILE = "order.csv"
+ORDER_TABLE = "order"
+POSITION = "Position"
+
+
+class Shard(typing.NamedTuple):
+    shard: int
+    shards: int
+
+    def __str__(self) -> str:
+        return f"{self.shard}/{self.shards}"
+
+
+def parse_shard(text: str) -> Shard:
+    """
+    Parses i/N, shards are counted from 1
+    """
+    shard, separator, shards = text.partition("/")
+    if not separator or not shard.isdigit() or not shards.isdigit() or not 1 <= int(shard) <= int(shards):
+        raise ValueError(f"Invalid shard {text}, expected i/N with 1 <= i <= N")
+
+    return Shard(int(shard), int(shards))
+
+
+def shard_dir(output_path: pathlib.Path, shard: Shard) -> pathlib.Path:
+    return output_path.joinpath(SHARD_DIR.format(shard=shard.shard, shards=shard.shards))
+
+
+def shard_of(relative_path: str, shards: int) -> int:
+    # the same file lands in the same shard on every machine and in every run
+    digest = hashlib.blake2b(relative_path.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards + 1
+
+
+def select_files(xml_files: list[scanner.ScannedFile], base_path: pathlib.Path, shard: Shard) -> list[scanner.ScannedFile]:
+    """
+    Keeps the files of the shard by the hash of their path relative to base_path, in scan order
+    """
+    return [
+        xml_file
+        for xml_file in xml_files
+        if shard_of(pathlib.Path(xml_file.path).relative_to(base_path).as_posix(), shard.shards) == shard.shard
+    ]
+
+
+def merge(output_path: pathlib.Path, shards: int) -> list[str]:
+    """
+    Merges the csv tables of all the shard directories into output_path in the order of a single machine run,
+    the rows of every shard are already in scan order so a k-way merge on the file position is enough.
+    Returns the merged table names.
+    """
+    shard_dirs = [shard_dir(output_path, Shard(shard, shards)) for shard in range(1, shards + 1)]
+
+    missing = [str(directory) for directory in shard_dirs if not directory.joinpath(ORDER_FILE).exists()]
+    if missing:
+        raise FileNotFoundError(f"No csv output in {', '.join(missing)}")
+
+    # the order file is there from the start of a run, the rows of a shard killed half way must not be merged
+    unfinished = [str(directory) for directory in shard_dirs if not is_finished(directory)]
+    if unfinished:
+        raise ValueError(f"Unfinished shard runs in {', '.join(unfinished)}, resume them with --resume before merging")
+
+    with open(shard_dirs[0].joinpath(ORDER_FILE), newline="") as f:
+        table_names = next(csv.reader(f))[1:]
+
+    for table_name in table_names:
+        _merge_table(output_path.joinpath(f"{table_name}.csv"), shard_dirs, table_name)
+
+    return table_names
+
+
+def is_finished(directory: pathlib.Path) -> bool:
+    """
+    Tells whether the run writing into directory got to its end: the metrics are only written then
+    and the checkpoint of a csv run is removed
+    """
+    return directory.joinpath(metrics.METRICS_FILE).exists() and not directory.joinpath(checkpoint.CHECKPOINT_FILE).exists()
+
+
+def _merge_table(target_file: pathlib.Path, shard_dirs: list[pathlib.Path], table_name: str) -> None:
+    with open(target_file, "w", newline="") as target:
+        writer = csv.writer(target, lineterminator="\n")
+
+        files = [open(directory.joinpath(f"{table_name}.csv"), newline="") for directory in shard_dirs]
+        try:
+            readers = [csv.reader(f) for f in files]
+
+            # every shard has the header of a single machine run
+            headers = [next(reader) for reader in readers]
+            if any(header != headers[0] for header in headers):
+                raise ValueError(f"The shards of {table_name} have different columns")
+            writer.writerow(headers[0])
+
+            streams = [_positioned_rows(directory, reader, table_name) for directory, reader in zip(shard_dirs, readers)]
+            for _, row in heapq.merge(*streams, key=lambda positioned: positioned[0]):
+                writer.writerow(row)
+        finally:
+            for f in files:
+                f.close()
+
+
+def _positioned_rows(
+    directory: pathlib.Path, reader: typing.Iterator[list[str]], table_name: str
+) -> typing.Generator[tuple[int, list[str]], None, None]:
+    with open(directory.joinpath(ORDER_FILE), newline="") as f:
+        for entry in csv.DictReader(f):
+            position = int(entry[POSITION])
+            for _ in range(int(entry[table_name])):
+                yield position, next(reader)
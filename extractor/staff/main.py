@@ -1,24 +1,17 @@
-import pathlib
+import typing
+from xml.dom.minidom import Document
 
-from extractor import scanner, printer, utils
+from extractor import utils
 from . import parser
 
+COLUMNS = parser.COLUMNS
+CHILD_COLUMNS = parser.CHILD_COLUMNS
+# Parquet and Arrow outputs get one directory per filing year and form type
+PARTITION_COLUMNS = [parser.FILING_YEAR, parser.FORM_TYPE]
+# a re-run replaces the rows stored in a database under the same filing
+KEY_COLUMNS = [parser.CHARITY_EIN, parser.FILING_YEAR, parser.FORM_TYPE]
+RECORD_EXTRACTORS = parser.RECORD_EXTRACTORS
 
-def parse(base_path: pathlib.Path, output_file: pathlib.Path) -> None:
-    xml_files = scanner.scan_xml_files(base_path)
 
-    organized_xmls = utils.organize_xmls(xml_files=xml_files)
-
-    # target_columns = [parser.BUSINESS_NAME, parser.EIN, parser.FILING_YEAR, parser.CITY_OR_TOWN, parser.STATE_OR_PROVINCE]
-
-    all_data: list[dict] = []
-
-    for ein, doc_type, file_name, document in organized_xmls:
-        print(f"Processing file {file_name}...")
-
-        multiple_lines = parser.extract_people_data(document)
-
-        if multiple_lines is not None:
-            all_data.extend(multiple_lines)
-
-    printer.to_csv(data=all_data, target_file=output_file)
+def extract(doc_type: str, document: Document, records: utils.Records | None = None) -> typing.Iterator[dict]:
+    return parser.extract_people_data(document, records=records)
@@ -4,12 +4,10 @@
 # Extract the files to create several CSV files
 #
 
-from datetime import datetime, date
-import pathlib
 import typing
-from xml.dom.minidom import parse, Document
+from xml.dom.minidom import Document
 
-from extractor import utils
+from extractor import schemas, utils
 
 # set the names for the constants which are used to hold extracted data xmls and properly arrange them
 FILING_YEAR = "Filing Year"
@@ -21,128 +19,98 @@ ZIPCODE = "Zip Code"
 FORM_TYPE = "Type"
 COUNTRY = "Country"
 ADDRESS1 = "Address 1"  # changed from Number and Street (some provided only a PO Box)
+EMPLOYEE_TYPE = "Employee Type"
+EMPLOYEE_NAME = "Employee Name"
+EMPLOYEE_TITLE = "Employee Title"
+EMPLOYEE_ADDRESS = "Employee Address"
+EMPLOYEE_COMPENSATION = "Employee Compensation"
+
+# output columns in the order they are written
+COLUMNS = [
+    FILING_YEAR, FORM_TYPE, CHARITY_EIN, BUSINESS_NAME, CITY_OR_TOWN, ZIPCODE, STATE_OR_PROVINCE, ADDRESS1, COUNTRY,
+    EMPLOYEE_TYPE, EMPLOYEE_NAME, EMPLOYEE_TITLE, EMPLOYEE_ADDRESS, EMPLOYEE_COMPENSATION,
+]
+# columns of the employee itself, the rest are the filer columns joined from the filings table
+CHILD_COLUMNS = [EMPLOYEE_TYPE, EMPLOYEE_NAME, EMPLOYEE_TITLE, EMPLOYEE_ADDRESS, EMPLOYEE_COMPENSATION]
+
+
+def extract_employee_info_1(employee_element: Document, schema: int) -> dict[str, str]:
+    employee_data = {}
+    employee_data[EMPLOYEE_TYPE] = "Form990PartVIISectionAGrp"
+
+    # employee name tag = PersonNm
+    name_tag = schemas.tag_name("PersonNm", schema, parent="Form990PartVIISectionAGrp")
+    employee_data[EMPLOYEE_NAME] = utils.extract_single_tag_value(employee_element, name_tag, optional=True)
+    # employee title tag = TitleTxt
+    employee_data[EMPLOYEE_TITLE] = utils.extract_single_tag_value(employee_element, schemas.tag_name("TitleTxt", schema))
+    # employee compensation
+    compensation_tag = schemas.tag_name("ReportableCompFromOrgAmt", schema)
+    employee_data[EMPLOYEE_COMPENSATION] = utils.extract_single_tag_value(employee_element, compensation_tag)
+
+    return employee_data
+
+
+def extract_employee_info_2(employee_element: Document, schema: int) -> dict[str, str] | None:
+    employee_data = {}
+    employee_data[EMPLOYEE_TYPE] = "OfficerDirectorTrusteeEmplGrp"
+    name_tag = schemas.tag_name("PersonNm", schema, parent="OfficerDirectorTrusteeEmplGrp")
+    employee_data[EMPLOYEE_NAME] = utils.extract_single_tag_value(employee_element, name_tag)
+    employee_data[EMPLOYEE_TITLE] = utils.extract_single_tag_value(employee_element, schemas.tag_name("TitleTxt", schema))
+
+    # Look for US address first
+    employee_address_element = utils.extract_single_tag(
+        employee_element, schemas.tag_name("RecipientUSAddress", schema), optional=True
+    )
+    if employee_address_element is None:
+        # Check if we have a foreign address
+        employee_address_element = utils.extract_single_tag(
+            employee_element, schemas.tag_name("RecipientForeignAddress", schema), optional=True
+        )
+        if employee_address_element is None:
+            # No address found!
+            return None
+
+    employee_data[EMPLOYEE_ADDRESS] = utils.format_address(employee_address_element, schema)
+
+    # key employee type of service tag = ???
+    # key employee position tag = ???
+    employee_data[EMPLOYEE_COMPENSATION] = utils.extract_single_tag_value(employee_element, schemas.tag_name("CompensationAmt", schema))
+    # key employee total compensation (all staff) =
+
+    return employee_data
+
+
+# repeated groups that become one row each, they can be extracted while the file is still being read
+# (OfficerDirTrstKeyEmplInfoGrp is left in the document, the organizations table reads it as well)
+RECORD_EXTRACTORS: dict[str, utils.RecordExtractor] = {
+    "Form990PartVIISectionAGrp": extract_employee_info_1,
+    "OfficerDirectorTrusteeEmplGrp": extract_employee_info_2,
+}
+
+
+def extract_employee_info_3(dom: Document) -> typing.Generator[dict[str, str], None, None]:
+    schema = utils.extract_schema(dom)
+    employee_elements = utils.extract_tag_instances(dom, schemas.tag_name("OfficerDirTrstKeyEmplInfoGrp", schema))
 
-def extract_common_data(dom: Document) -> dict[str, str] | None:
-    data = {}
-
-    return_element = utils.extract_single_tag(dom, "Return")
-    header_element = utils.extract_single_tag(return_element, "ReturnHeader")
-    filer_element = utils.extract_single_tag(header_element, "Filer")
-
-    # Get the filing year
-    tax_period_begin_text = utils.extract_single_tag_value(header_element, "TaxPeriodBeginDt")
-    tax_period_begin: date = datetime.strptime(tax_period_begin_text, "%Y-%m-%d")
-    data[FILING_YEAR] = tax_period_begin.year
-
-    # get file type
-    data[FORM_TYPE] = utils.extract_single_tag_value(header_element, "ReturnTypeCd")
-
-    # Get Charity EIN
-    data[CHARITY_EIN] = utils.extract_single_tag_value(filer_element, "EIN")
-
-    # Get filer business name
-    business_name_element = utils.extract_single_tag(filer_element, "BusinessName")
-    data[BUSINESS_NAME] = utils.extract_single_tag_value(business_name_element, "BusinessNameLine1Txt")
-
-    # find address section and step into it
-    us_address_element = utils.extract_single_tag(filer_element, "USAddress")
-
-    # find the filer city/town
-    data[CITY_OR_TOWN] = utils.extract_single_tag_value(us_address_element, "CityNm")
-
-    # find the filer zipcode
-    data[ZIPCODE] = utils.extract_single_tag_value(us_address_element, "ZIPCd")
-
-    # find the filer state/province
-    data[STATE_OR_PROVINCE] = utils.extract_single_tag_value(us_address_element, "StateAbbreviationCd")
-
-    # find the filer address
-    data[ADDRESS1] = utils.extract_single_tag_value(us_address_element, "AddressLine1Txt")
-
-    # set the filer address to US
-    data[COUNTRY] = "US"  # If USAddress fails, we will need to change this but so far only US addresses were found 
-
-    return data
-
-
-def extract_employee_info_1(dom: Document, common_data: dict) -> list[dict[str, str]]:
-    records = []
-    
-    employee_elements = utils.extract_tag_instances(dom, "Form990PartVIISectionAGrp")
-    
     for employee_element in employee_elements:
-        # Create a new record for this contractor and fill in common data
-        employee_data = {**common_data}
-        employee_data["Employee Type"] = "Form990PartVIISectionAGrp"
-
-        # employee name tag = PersonNm
-        employee_data["Employee Name"] = utils.extract_single_tag_value(employee_element, "PersonNm", optional=True)
-        # employee title tag = TitleTxt
-        employee_data["Employee Title"] = utils.extract_single_tag_value(employee_element, "TitleTxt")
-        # employee compensation
-        employee_data["Employee Compensation"] = utils.extract_single_tag_value(employee_element, "ReportableCompFromOrgAmt")
-
-        records.append(employee_data)
-
-    return records
-
-
-def extract_employee_info_2(dom: Document, common_data: dict) -> list[dict[str, str]]:
-    records = []
-    
-    employee_elements = utils.extract_tag_instances(dom, "OfficerDirectorTrusteeEmplGrp")
-
-    for employee_element in employee_elements:
-        # Create a new record for this contractor and fill in common data
-        employee_data = {**common_data}
-        employee_data["Employee Type"] = "OfficerDirectorTrusteeEmplGrp"
-        employee_data["Employee Name"] = utils.extract_single_tag_value(employee_element, "PersonNm")
-        employee_data["Employee Title"] = utils.extract_single_tag_value(employee_element, "TitleTxt")
-
-        # Look for US address first
-        employee_address_element = utils.extract_single_tag(employee_element, "RecipientUSAddress", optional=True)
-        if not employee_address_element:
-            # Check if we have a foreign address
-            employee_address_element = utils.extract_single_tag(employee_element, "RecipientForeignAddress", optional=True)
-            if not employee_address_element:
-                # No address found!
-                continue
-
-        employee_data["Employee Address"] = utils.format_address(employee_address_element)
-    
-
-
-
-        # key employee type of service tag = ???
-        # key employee position tag = ???
-        employee_data["Employee Compensation"] = utils.extract_single_tag_value(employee_element, "CompensationAmt")
-        # key employee total compensation (all staff) =
-
-        records.append(employee_data)
-
-    return records
-
-
-def extract_employee_info_3(dom: Document, common_data: dict) -> list[dict[str, str]]:
-    records = []
-    
-    employee_elements = utils.extract_tag_instances(dom, "OfficerDirTrstKeyEmplInfoGrp")
-
-    for employee_element in employee_elements:
-        # Create a new record for this contractor and fill in common data
-        employee_data = {**common_data}
-        employee_data["Employee Type"] = "OfficerDirTrstKeyEmplInfoGrp"
-        # employee_data["Employee Name"] = utils.extract_single_tag_value(employee_element, "PersonNm")
-        employee_data["Employee Title"] = utils.extract_single_tag_value(employee_element, "TitleTxt", optional=True)
-        employee_data["Employee Address"] = utils.extract_single_tag_value(employee_element, "AddressLine1Txt", optional=True)
+        # Create a new record for this contractor
+        employee_data = {}
+        employee_data[EMPLOYEE_TYPE] = "OfficerDirTrstKeyEmplInfoGrp"
+        # employee_data[EMPLOYEE_NAME] = utils.extract_single_tag_value(employee_element, "PersonNm")
+        employee_data[EMPLOYEE_TITLE] = utils.extract_single_tag_value(
+            employee_element, schemas.tag_name("TitleTxt", schema), optional=True
+        )
+        employee_data[EMPLOYEE_ADDRESS] = utils.extract_single_tag_value(
+            employee_element, schemas.tag_name("AddressLine1Txt", schema), optional=True
+        )
         # key employee type of service tag = ???
         # key employee position tag = ???
-        employee_data["Employee Compensation"] = utils.extract_single_tag_value(employee_element, "CompensationAmt", optional=True)
+        employee_data[EMPLOYEE_COMPENSATION] = utils.extract_single_tag_value(
+            employee_element, schemas.tag_name("CompensationAmt", schema), optional=True
+        )
         # key employee total compensation (all staff) =
 
-        records.append(employee_data)
-
-    return records
+        yield employee_data
 
 
 def extract_contractor_data(dom: Document, common_data: dict) -> list[dict[str, str]]:
@@ -153,11 +121,14 @@ def extract_contractor_data(dom: Document, common_data: dict) -> list[dict[str,
     return []
 
 
-def extract_people_data(dom: Document) -> list[dict[str, str]] | None:
-    common_data = extract_common_data(dom)
-
-    employees_from_990 = extract_employee_info_1(dom=dom, common_data=common_data)
-    employees_from_990EZ = extract_employee_info_2(dom=dom, common_data=common_data)
-    employees_from_990PF = extract_employee_info_3(dom=dom, common_data=common_data)
+def extract_people_data(dom: Document, records: utils.Records | None = None) -> typing.Generator[dict[str, str], None, None]:
+    """
+    Yields the employee columns of every employee, the filer columns (common data) are joined in when the rows are written
+    """
+    if records is None:
+        records = utils.collect_records(dom, RECORD_EXTRACTORS)
 
-    return [*employees_from_990, *employees_from_990EZ, *employees_from_990PF]
+    # 990, 990EZ and 990PF employees, one after the other without building a list of each
+    yield from (record for _, record in records["Form990PartVIISectionAGrp"])
+    yield from (record for _, record in records["OfficerDirectorTrusteeEmplGrp"])
+    yield from extract_employee_info_3(dom=dom)
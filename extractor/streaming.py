@@ -0,0 +1,76 @@
+import io
+import mmap
+import typing
+from xml.etree import ElementTree
+
+from extractor import schemas, utils
+
+# stands in for the minidom Document node above the Return element
+DOCUMENT_TAG = utils.DOCUMENT_TAG
+
+
+class StreamedDocument(ElementTree.Element):
+    # unlike a plain Element it can carry the tag index of utils.tag_index
+    pass
+
+
+def parse_xml_records(data: bytes | mmap.mmap, record_extractors: dict[str, utils.RecordExtractor]) -> tuple[ElementTree.Element, utils.Records]:
+    """
+    Parses the file contents with iterparse, every record tag is extracted as soon as it closes and its subtree is dropped.
+    Returns what is left of the document (header and form level fields) together with the record rows.
+    """
+    records: utils.Records = {tag_name: [] for tag_name in record_extractors}
+
+    # a memory map is read like a file, plain bytes get wrapped in one
+    source = data if isinstance(data, mmap.mmap) else io.BytesIO(data)
+    events = ElementTree.iterparse(source, events=("start", "end"))
+    document = _stream(events, record_extractors, records)
+
+    return document, records
+
+
+def _stream(events: typing.Iterator, record_extractors: dict[str, utils.RecordExtractor], records: utils.Records) -> ElementTree.Element:
+    document = StreamedDocument(DOCUMENT_TAG)
+    stack = [document]
+    # records nested inside another record are kept until the outer one is extracted
+    open_records = 0
+    # the record tags under their tag names in the schema of the file, known once the root element starts
+    schema = schemas.CURRENT_SCHEMA
+    record_tags = {tag_name: tag_name for tag_name in record_extractors}
+
+    for event, element in events:
+        if event == "start":
+            # match the minidom tag names which come without the IRS namespace
+            element.tag = element.tag.rpartition("}")[2]
+
+            if len(stack) == 1:
+                schema = schemas.schema_of(element.get("returnVersion"))
+                record_tags = {schemas.tag_name(tag_name, schema): tag_name for tag_name in record_extractors}
+
+            if element.tag in record_tags:
+                open_records += 1
+
+            stack.append(element)
+            continue
+
+        stack.pop()
+        parent = stack[-1]
+
+        if len(stack) == 1:
+            # the root element closed, hang it under the document like minidom does
+            document.append(element)
+            continue
+
+        tag_name = record_tags.get(element.tag)
+        if tag_name is None:
+            continue
+
+        record = record_extractors[tag_name](element, schema)
+        if record is not None:
+            records[tag_name].append((parent, record))
+
+        open_records -= 1
+        if open_records == 0:
+            parent.remove(element)
+
+    return document
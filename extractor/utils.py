@@ -1,28 +1,48 @@
+import contextlib
+import mmap
+import os
 import pathlib
 import typing
-from xml.dom.minidom import Node, Document, parse
+from xml.dom.minidom import Node, Document, parseString
+from xml.etree import ElementTree
 
-def read_xml(file_path: pathlib.Path):
-    print(f"Parsing {file_path}")
+from extractor import schemas
 
-    with open(file_path, "r") as f:
-        return parse(f)
+# extracts one row (or None to skip it) out of a repeated group element, e.g. one grant or one employee,
+# reading its children with the tag names of the schema (see schemas.tag_name)
+RecordExtractor = typing.Callable[[Document, int], dict | None]
 
+# record rows of every group tag (its current tag name), each one paired with the parent element of the group
+Records = dict[str, list[tuple[Document, dict]]]
 
-def organize_xmls(xml_files: list[str]) -> typing.Generator[tuple[str, str, str, Document], None, None]:
-    for xml_file in xml_files:
-        document = read_xml(xml_file)
+# stands in for the minidom Document node above the Return element when parsing with ElementTree
+DOCUMENT_TAG = "#document"
 
-        ein = extract_ein(document)
-        document_type = extract_file_type(document)
+# attribute of a document holding its tag index
+TAG_INDEX_ATTRIBUTE = "_tag_index"
 
-        yield ein, document_type, xml_file, document
 
+def parse_xml_records(data: bytes | mmap.mmap, record_extractors: dict[str, RecordExtractor]) -> tuple[Document, Records]:
+    """
+    Parses the whole file contents with minidom and extracts every instance of the record tags
+    """
+    document = parseString(data)
+    return document, collect_records(document, record_extractors)
 
-def extract_ein(root_element: Document) -> str:
-    header_element = extract_header(root_element)
-    filer_element = extract_single_tag(header_element, "Filer")
-    return extract_single_tag_value(filer_element, "EIN")
+
+def collect_records(document: Document, record_extractors: dict[str, RecordExtractor]) -> Records:
+    records: Records = {}
+    schema = extract_schema(document)
+
+    for tag_name, record_extractor in record_extractors.items():
+        records[tag_name] = []
+
+        for element in extract_tag_instances(document, schemas.tag_name(tag_name, schema)):
+            record = record_extractor(element, schema)
+            if record is not None:
+                records[tag_name].append((element.parentNode, record))
+
+    return records
 
 
 def extract_header(root_element: Document) -> Document:
@@ -32,7 +52,27 @@ def extract_header(root_element: Document) -> Document:
 
 def extract_file_type(root_element: Document) -> str:
     header_element = extract_header(root_element)
-    return extract_single_tag_value(header_element, "ReturnTypeCd")
+    return extract_single_tag_value(header_element, schemas.tag_name("ReturnTypeCd", extract_schema(root_element)))
+
+
+def extract_schema(root_element: Document) -> int:
+    """
+    Returns the schema the document was written with, see schemas.schema_of
+    """
+    return schemas.schema_of(extract_return_version(root_element))
+
+
+def extract_return_version(root_element: Document) -> str | None:
+    """
+    Returns the returnVersion attribute of the Return element (e.g. 2021v4.2), None when it has none
+    """
+    for return_element in child_elements(root_element):
+        if isinstance(return_element, ElementTree.Element):
+            return return_element.get("returnVersion")
+
+        return return_element.getAttribute("returnVersion") or None
+
+    return None
 
 
 def extract_single_tag(parent: Document, tag_name: str, optional: bool = False) -> Document:
@@ -40,8 +80,8 @@ def extract_single_tag(parent: Document, tag_name: str, optional: bool = False)
     Returns a direct chile element of given name
     """
     all_elements = []
-    for node in parent.childNodes:
-        if node.nodeType == Node.ELEMENT_NODE and node.tagName == tag_name:
+    for node in child_elements(parent):
+        if element_name(node) == tag_name:
             all_elements.append(node)
 
     if len(all_elements) == 0 and optional:
@@ -60,34 +100,118 @@ def extract_single_tag_value(
     if element is None and optional:
         return "" # returns empty strign if element is not found
 
+    return element_value(element, tag_name)
+
+
+def element_value(element: Document, tag_name: str) -> str:
+    """
+    Returns the text inside an element
+    """
+    if isinstance(element, ElementTree.Element):
+        if element.text is None:
+            # same failure as firstChild.nodeValue on an empty minidom element
+            raise AttributeError(f"{tag_name} has no value")
+        return element.text
+
     return element.firstChild.nodeValue
 
 
 def extract_tag_instances(parent: Document, tag_name: str) -> list[Document]:
     """
-    Returns a list of all the children nodes (of the given tag name) recursively anywhere under parent
+    Returns a list of all the children nodes (of the given tag name) recursively anywhere under parent.
+    Under a whole document they come from its tag index, so looking up several tags walks the tree only once.
     """
+    if is_document(parent):
+        return tag_index(parent).get(tag_name, [])
+
+    if isinstance(parent, ElementTree.Element):
+        return [element for element in parent.iter(tag_name) if element is not parent]
+
     return parent.getElementsByTagName(tag_name)
 
 
-def format_address(address_element: Document) -> str:
+def is_document(node: Document) -> bool:
+    if isinstance(node, ElementTree.Element):
+        return node.tag == DOCUMENT_TAG
+
+    return node.nodeType == Node.DOCUMENT_NODE
+
+
+def tag_index(document: Document) -> dict[str, list[Document]]:
+    """
+    Returns every element of the document by tag name, in document order. The index is built by a single walk
+    of the tree and kept on the document, it goes away with it (documents are not changed once extraction starts).
+    """
+    index = getattr(document, TAG_INDEX_ATTRIBUTE, None)
+    if index is None:
+        index = _build_tag_index(document)
+        setattr(document, TAG_INDEX_ATTRIBUTE, index)
+
+    return index
+
+
+def _build_tag_index(document: Document) -> dict[str, list[Document]]:
+    index: dict[str, list[Document]] = {}
+
+    if isinstance(document, ElementTree.Element):
+        for element in document.iter():
+            if element is not document:
+                index.setdefault(element.tag, []).append(element)
+        return index
+
+    _index_children(document, index)
+    return index
+
+
+def _index_children(node: Document, index: dict[str, list[Document]]) -> None:
+    # depth first, same order as getElementsByTagName. Runs for every element of every filing, hence the inlined checks
+    for child in node.childNodes:
+        if child.nodeType == Node.ELEMENT_NODE:
+            elements = index.get(child.tagName)
+            if elements is None:
+                index[child.tagName] = [child]
+            else:
+                elements.append(child)
+
+            if child.childNodes:
+                _index_children(child, index)
+
+
+def child_elements(parent: Document) -> typing.Iterable[Document]:
+    """
+    Returns the direct child elements of a minidom node or an ElementTree element
+    """
+    if isinstance(parent, ElementTree.Element):
+        return parent
+
+    return (node for node in parent.childNodes if node.nodeType == Node.ELEMENT_NODE)
+
+
+def element_name(element: Document) -> str:
+    if isinstance(element, ElementTree.Element):
+        return element.tag
+
+    return element.tagName
+
+
+def format_address(address_element: Document, schema: int) -> str:
     address = ""
 
-    if address_element.nodeName == "RecipientUSAddress":
+    if element_name(address_element) == schemas.tag_name("RecipientUSAddress", schema):
         # Format US address 
-        numeral_address = extract_single_tag_value(address_element, "AddressLine1Txt")
-        city_name = extract_single_tag_value(address_element, "CityNm")
-        state = extract_single_tag_value(address_element, "StateAbbreviationCd")
-        zipcode = extract_single_tag_value(address_element, "ZIPCd")
+        numeral_address = extract_single_tag_value(address_element, schemas.tag_name("AddressLine1Txt", schema))
+        city_name = extract_single_tag_value(address_element, schemas.tag_name("CityNm", schema))
+        state = extract_single_tag_value(address_element, schemas.tag_name("StateAbbreviationCd", schema))
+        zipcode = extract_single_tag_value(address_element, schemas.tag_name("ZIPCd", schema))
 
         address = f"{numeral_address}, {city_name}, {state} {zipcode}"
 
-    elif address_element.nodeName == "RecipientForeignAddress":
+    elif element_name(address_element) == schemas.tag_name("RecipientForeignAddress", schema):
         # Format foreign address
-        numeral_address = extract_single_tag_value(address_element, "AddressLine1Txt")
-        city_name = extract_single_tag_value(address_element, "CityNm", optional=True)
-        state = extract_single_tag_value(address_element, "ProvinceOrStateNm", optional=True)
-        country_code = extract_single_tag_value(address_element, "CountryCd")
+        numeral_address = extract_single_tag_value(address_element, schemas.tag_name("AddressLine1Txt", schema))
+        city_name = extract_single_tag_value(address_element, schemas.tag_name("CityNm", schema), optional=True)
+        state = extract_single_tag_value(address_element, schemas.tag_name("ProvinceOrStateNm", schema), optional=True)
+        country_code = extract_single_tag_value(address_element, schemas.tag_name("CountryCd", schema))
 
         address += numeral_address + ", "
 
@@ -100,3 +224,22 @@ def format_address(address_element: Document) -> str:
         address += country_code
 
     return address 
+
+
+@contextlib.contextmanager
+def replace_file(
+    target_file: pathlib.Path, mode: str = "w", opener: typing.Callable[..., typing.IO] = open
+) -> typing.Generator[typing.IO, None, None]:
+    """
+    Opens a file next to target_file for writing and swaps it in for target_file once it is written,
+    a killed process never leaves a truncated file behind. opener is e.g. gzip.open for a compressed file.
+    """
+    temp_file = target_file.with_name(f"{target_file.name}.tmp")
+    try:
+        with opener(temp_file, mode) as f:
+            yield f
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_file, target_file)
@@ -0,0 +1,330 @@
+import gzip
+import json
+import os
+import pathlib
+import time
+import typing
+
+from extractor import checkpoint, pipeline, scanner, utils
+
+WATCH_STATE_FILE = "watch.json"
+# log of the directory listings the committed outputs were extracted from, a new file per compaction (see Watcher.commit)
+WATCH_INDEX_FILE = "watch-index-{generation}.json.gz"
+WATCH_STATE_VERSION = 2
+
+# the index log is rewritten with only the current listings once it has grown to this many times its compacted size
+COMPACT_FACTOR = 2
+
+# formats whose outputs can be appended to, the partitioned ones are rewritten from scratch by every run
+WATCH_FORMATS = ["csv", "sqlite"]
+
+# seconds between two polls of the data directory
+POLL_INTERVAL = 5.0
+# files modified less than this many seconds ago may still be synced, they are picked up by a later poll
+SETTLE_TIME = 2.0
+
+
+class WatchState(typing.NamedTuple):
+    """
+    What the outputs hold: the listings of the extracted directories (the first index_size bytes of the index log
+    of the generation) and how far every csv output and the quarantine report had been written after the last commit
+    """
+
+    generation: int
+    index_size: int
+    compacted_size: int
+    offsets: dict[str, int]
+    quarantine: int
+    files: int
+    base_path: str
+    output_format: str
+    layout: str
+    tables: list[str]
+
+
+class Watcher:
+    """
+    Extracts the files that appeared in the data directory since the last poll and appends their rows to the outputs.
+    Only directories whose mtime changed are listed again. Every poll is committed at once by swapping in a new state
+    file, a poll that was interrupted is cut off the outputs and extracted again by the next one.
+    """
+
+    def __init__(
+        self,
+        base_path: pathlib.Path,
+        output_path: pathlib.Path,
+        workers: int = 1,
+        engine: str = "minidom",
+        output_format: str = "csv",
+        layout: str = "denormalized",
+        tables: typing.Iterable[str] | None = None,
+        scan_workers: int = 8,
+        read_ahead: int = pipeline.READ_AHEAD,
+        skip_existing: bool = False,
+        settle_time: float = SETTLE_TIME,
+    ):
+        if output_format not in WATCH_FORMATS:
+            raise ValueError(f"Only {', '.join(WATCH_FORMATS)} outputs can be appended to, not {output_format}")
+
+        self.base_path = base_path
+        self.output_path = output_path
+        self.workers = workers
+        self.engine = engine
+        self.output_format = output_format
+        self.layout = layout
+        self.outputs = pipeline.select_outputs(layout, tables)
+        self.scan_workers = scan_workers
+        self.read_ahead = read_ahead
+        self.settle_time = settle_time
+
+        self.state_file = output_path.joinpath(WATCH_STATE_FILE)
+        self.state = load(self.state_file)
+
+        if self.state is None:
+            self.state = WatchState(0, 0, 0, {}, 0, 0, str(base_path), output_format, layout, list(self.outputs))
+            self.index: dict[str, tuple[int, scanner.Listing]] = {}
+            # listings changed since the last commit, None for a removed directory
+            self.pending: dict[str, tuple[int, scanner.Listing] | None] = {}
+
+            # the files already there count as extracted (by an earlier batch run), only the ones arriving from now on are
+            if skip_existing:
+                quarantine_file = output_path.joinpath(checkpoint.QUARANTINE_FILE)
+                if quarantine_file.exists():
+                    self.state = self.state._replace(quarantine=os.path.getsize(quarantine_file))
+
+                self.index = scanner.list_directories(base_path, workers=scan_workers)
+                self.commit(self.state.files)
+        else:
+            if (self.state.base_path, self.state.output_format, self.state.layout, self.state.tables) != (
+                str(base_path),
+                output_format,
+                layout,
+                list(self.outputs),
+            ):
+                raise ValueError(
+                    f"{self.state_file} was written for other data, format, layout or tables, remove it to start from scratch"
+                )
+
+            self.index = load_listings(self.index_file(self.state.generation), self.state.index_size)
+            self.pending = {}
+
+    def index_file(self, generation: int) -> pathlib.Path:
+        return self.output_path.joinpath(WATCH_INDEX_FILE.format(generation=generation))
+
+    def poll(self) -> list[scanner.ScannedFile]:
+        """
+        Extracts the new files and commits their rows, returns the new files
+        """
+        changed: set[str] = set()
+        # an archive that is still being synced can not be listed yet, its directory is listed again by the next poll
+        listings = scanner.list_directories(
+            self.base_path, workers=self.scan_workers, index=self.index, changed=changed, failed=[]
+        )
+
+        new_files, updates = self.new_files(listings, changed)
+        if not new_files:
+            # nothing to commit, the listings are kept so the changed directories are not listed again
+            # (the ones with unsettled files are, see new_files)
+            self.update_index(listings, updates)
+            return []
+
+        quarantine_file = self.output_path.joinpath(checkpoint.QUARANTINE_FILE)
+        quarantine_offset = self.state.quarantine if quarantine_file.exists() else None
+
+        with checkpoint.Quarantine(quarantine_file, offset=quarantine_offset) as quarantine:
+            extracted = pipeline.extract_files(
+                new_files,
+                workers=self.workers,
+                engine=self.engine,
+                quarantine=quarantine,
+                read_ahead=self.read_ahead,
+                table_names=pipeline.required_tables(self.outputs),
+            )
+
+            # the csv outputs are cut back to the last commit, rows of an interrupted poll do not stay behind
+            pipeline.write_tables(
+                self.output_path,
+                extracted,
+                output_format=self.output_format,
+                offsets=self.offsets(),
+                layout=self.layout,
+                base_path=self.base_path,
+                tables=list(self.outputs),
+            )
+
+            self.state = self.state._replace(quarantine=quarantine.offset())
+
+        self.update_index(listings, updates)
+        self.commit(self.state.files + len(new_files))
+        return new_files
+
+    def new_files(
+        self, listings: dict[str, tuple[int, scanner.Listing]], changed: set[str]
+    ) -> tuple[list[scanner.ScannedFile], dict[str, tuple[int, scanner.Listing] | None]]:
+        """
+        Returns the settled files that were not in the index and the listing updates to commit once they are extracted,
+        only the changed directories (the ones listed again) are looked at. Directories that are gone are updated to None.
+        The listing of a directory with unsettled files is committed without them and with an mtime that makes
+        the next poll list it again.
+        """
+        settled_before = time.time_ns() - int(self.settle_time * 1e9)
+
+        new_files = []
+        updates: dict[str, tuple[int, scanner.Listing] | None] = {}
+        for relative_dir in sorted(changed):
+            mtime_ns, listing = listings[relative_dir]
+            known = self.index.get(relative_dir)
+            known_names = {name for name, _, _ in known[1]} if known is not None else set()
+
+            unsettled = set()
+            for name, size, file_mtime_ns in listing:
+                if size is None or name in known_names:
+                    continue
+
+                if file_mtime_ns > settled_before:
+                    unsettled.add(name)
+                else:
+                    new_files.append(scanner.ScannedFile(self.base_path.joinpath(relative_dir, name), size, file_mtime_ns))
+
+            if unsettled:
+                updates[relative_dir] = (-1, [entry for entry in listing if entry[0] not in unsettled])
+            else:
+                updates[relative_dir] = (mtime_ns, listing)
+
+            # a removed subdirectory only shows in the listing of its parent, everything under it is gone as well
+            if known is not None:
+                subdirs = {name for name, size, _ in listing if size is None}
+                for name, size, _ in known[1]:
+                    if size is None and name not in subdirs:
+                        removed_dir = pathlib.PurePosixPath(relative_dir, name).as_posix()
+                        updates.update(dict.fromkeys(_subtree(self.index, removed_dir)))
+
+        return new_files, updates
+
+    def update_index(
+        self, listings: dict[str, tuple[int, scanner.Listing]], updates: dict[str, tuple[int, scanner.Listing] | None]
+    ) -> None:
+        # the removed directories are not in the listings any more
+        listings.update((relative_dir, listing) for relative_dir, listing in updates.items() if listing is not None)
+        self.index = listings
+        self.pending.update(updates)
+
+    def offsets(self) -> dict[str, int] | None:
+        if self.output_format != "csv" or not self.state.offsets:
+            return None
+
+        return self.state.offsets
+
+    def commit(self, files: int) -> None:
+        # the changed listings are appended to the index log and the state file holding its new size is swapped in,
+        # the end of an interrupted append is ignored. A log grown too big is compacted into a new file instead.
+        generation = self.state.generation
+        if generation == 0 or self.state.index_size >= COMPACT_FACTOR * self.state.compacted_size:
+            generation += 1
+            index_size = compacted_size = append_listings(self.index_file(generation), 0, self.index)
+        else:
+            index_size = append_listings(self.index_file(generation), self.state.index_size, self.pending)
+            compacted_size = self.state.compacted_size
+
+        offsets = {}
+        if self.output_format == "csv":
+            offsets = {
+                output_name: os.path.getsize(self.output_path.joinpath(f"{output_name}.csv"))
+                for output_name in self.outputs
+                if self.output_path.joinpath(f"{output_name}.csv").exists()
+            }
+
+        previous_generation = self.state.generation
+        self.state = self.state._replace(
+            generation=generation, index_size=index_size, compacted_size=compacted_size, offsets=offsets, files=files
+        )
+        save(self.state_file, self.state)
+        self.pending = {}
+
+        if generation != previous_generation:
+            self.index_file(previous_generation).unlink(missing_ok=True)
+
+
+def load(state_file: pathlib.Path) -> WatchState | None:
+    """
+    Returns the saved state, None when there is none or it was saved by another version
+    """
+    if not state_file.exists():
+        return None
+
+    state = json.loads(state_file.read_text())
+    if state.pop("version", None) != WATCH_STATE_VERSION:
+        return None
+
+    return WatchState(**state)
+
+
+def load_listings(index_file: pathlib.Path, index_size: int) -> dict[str, tuple[int, scanner.Listing]]:
+    """
+    Replays the first index_size bytes of an index log, the later listings of a directory replace the earlier ones
+    """
+    with open(index_file, "rb") as f:
+        data = gzip.decompress(f.read(index_size))
+
+    listings = {}
+    for line in data.splitlines():
+        relative_dir, mtime_ns, listing = json.loads(line)
+        if listing is None:
+            listings.pop(relative_dir, None)
+        else:
+            listings[relative_dir] = (mtime_ns, [tuple(entry) for entry in listing])
+
+    return listings
+
+
+def append_listings(
+    index_file: pathlib.Path, index_size: int, listings: dict[str, tuple[int, scanner.Listing] | None]
+) -> int:
+    """
+    Appends the listings to the first index_size bytes of an index log (a new log with 0) and returns its new size
+    """
+    lines = "".join(
+        json.dumps([relative_dir, *(listing if listing is not None else (None, None))], separators=(",", ":")) + "\n"
+        for relative_dir, listing in listings.items()
+    )
+
+    with open(index_file, "r+b" if index_size else "wb") as f:
+        # every append is a gzip member of its own, they are read back as one stream
+        f.truncate(index_size)
+        f.seek(index_size)
+        f.write(gzip.compress(lines.encode()))
+        return f.tell()
+
+
+def _subtree(
+    index: dict[str, tuple[int, scanner.Listing]], relative_dir: str
+) -> typing.Generator[str, None, None]:
+    # the directory and all its subdirectories known to the index
+    yield relative_dir
+
+    for name, size, _ in index.get(relative_dir, (None, []))[1]:
+        if size is None:
+            yield from _subtree(index, pathlib.PurePosixPath(relative_dir, name).as_posix())
+
+
+def save(state_file: pathlib.Path, state: WatchState) -> None:
+    with utils.replace_file(state_file) as f:
+        f.write(json.dumps({"version": WATCH_STATE_VERSION, **state._asdict()}))
+
+
+def watch(
+    watcher: Watcher,
+    interval: float = POLL_INTERVAL,
+    on_poll: typing.Callable[[list[scanner.ScannedFile]], None] | None = None,
+) -> None:
+    """
+    Polls the data directory every interval seconds until interrupted
+    """
+    while True:
+        started = time.monotonic()
+        new_files = watcher.poll()
+
+        if on_poll is not None:
+            on_poll(new_files)
+
+        time.sleep(max(interval - (time.monotonic() - started), 0))
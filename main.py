@@ -1,4 +1,4 @@
 import runpy
 
 if __name__ == "__main__":
-    runpy.run_module("extractor")
+    runpy.run_module("extractor", run_name="__main__")